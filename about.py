@@ -2,7 +2,7 @@
 # for localized messages
 from . import _
 
-import e2m3u2bouquet
+from lazyimport import LazyModule
 
 from Screens.Screen import Screen
 from Components.Label import Label
@@ -12,6 +12,9 @@ from Components.Button import Button
 from Tools.Directories import resolveFilename, SCOPE_PLUGINS
 from enigma import getDesktop
 
+# imported on first use, see lazyimport
+e2m3u2bouquet = LazyModule('e2m3u2bouquet')
+
 ScreenWidth = getDesktop(0).size().width()
 ScreenWidth = 'HD' if ScreenWidth and ScreenWidth >= 1920 else 'SD'
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+M3U parse benchmark: regex-per-line loop vs the incremental tokenizer, and the
+whole Provider.download_m3u (parse, validation, stream type classification)
+
+The legacy loop uses the URL pattern of the loop it replaced. download_m3u reads
+a file:// playlist in a child process, --compare runs it again with the
+e2m3u2bouquet of another checkout (e.g. a git worktree of an older commit).
+
+usage: python2 benchmarks/bench_m3u.py [--vod-ratio R] [--compare TREE] [entries]
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from synthetic import make_playlist, iter_chunks
+
+# parse loop as it was in Provider.download_m3u
+TAG_PATTERN = re.compile(r'.*?(url-logo|url-tvg|url-epg|tvg-id|tvg-name|tvg-logo|group-title)=[\'"](.*?)[\'"]')
+
+ip_middle_octet = u"(?:\.(?:1?\d{1,2}|2[0-4]\d|25[0-5]))"
+ip_last_octet = u"(?:\.(?:[1-9]\d?|1\d\d|2[0-4]\d|25[0-4]))"
+
+LEGACY_URL_PATTERN = re.compile(
+    u"^"
+    u"(?:(?:https?|rtsp|rtp|mmp)://)"
+    u"(?:\S+(?::\S*)?@)?"
+    u"(?:"
+    u"(?P<private_ip>"
+    u"(?:(?:10|127)" + ip_middle_octet + u"{2}" + ip_last_octet + u")|"
+    u"(?:(?:169\.254|192\.168)" + ip_middle_octet + ip_last_octet + u")|"
+    u"(?:172\.(?:1[6-9]|2\d|3[0-1])" + ip_middle_octet + ip_last_octet + u"))"
+    u"|"
+    u"(?P<public_ip>"
+    u"(?:[1-9]\d?|1\d\d|2[01]\d|22[0-3])"
+    u"" + ip_middle_octet + u"{2}"
+    u"" + ip_last_octet + u")"
+    u"|"
+    u"(?:(?:[a-z\u00a1-\uffff0-9]-?)*[a-z\u00a1-\uffff0-9]+)"
+    u"(?:\.(?:[a-z\u00a1-\uffff0-9]-?)*[a-z\u00a1-\uffff0-9]+)*"
+    u"(?:\.(?:[a-z\u00a1-\uffff]{2,}))"
+    u")"
+    u"(?::\d{2,5})?"
+    u"(?:/\S*)?"
+    u"(?:\?\S*)?"
+    u"$",
+    re.UNICODE | re.IGNORECASE
+)
+
+
+def legacy_parse(data):
+    services = []
+    service_dict = {}
+    name = None
+    for line in data.splitlines():
+        line = line.decode('utf-8-sig')
+        if line.startswith('#EXTM3U'):
+            service_dict.update(dict(TAG_PATTERN.findall(line)))
+            service_dict = {}
+        elif line.startswith('#EXTINF:'):
+            try:
+                extInfData, name = line.split(',')
+            except:
+                extInfData, name = line, None
+            service_dict.update(dict(TAG_PATTERN.findall(extInfData)))
+            if name is None:
+                name = service_dict.get('tvg-name')
+            service_dict['stream-name'] = name.strip()
+        elif re.compile(LEGACY_URL_PATTERN).match(line) and name:
+            service_dict['stream-url'] = line.strip()
+            services.append(service_dict)
+            service_dict = {}
+    return services
+
+
+def tokenizer_parse(data):
+    import m3uparser
+    from e2m3u2bouquet import url_validate
+    tokenizer = m3uparser.M3UTokenizer(is_url=url_validate)
+    return [record for record in m3uparser.iter_m3u(iter_chunks(data, m3uparser.CHUNK_SIZE), tokenizer)
+            if isinstance(record, m3uparser.M3UEntry)]
+
+
+def run(name, func, data, lines):
+    start = time.time()
+    count = len(func(data))
+    elapsed = time.time() - start
+    print('{:<14} {:>8} services {:>8.3f}s {:>12.0f} lines/s'.format(name, count, elapsed, lines / elapsed))
+
+
+def download_m3u(tree, playlist):
+    """Run Provider.download_m3u of the e2m3u2bouquet in tree on playlist, returns (seconds, channels)"""
+    sys.path.insert(0, tree)
+    import e2m3u2bouquet
+    tmp = tempfile.mkdtemp()
+    try:
+        e2m3u2bouquet.ENIGMAPATH = tmp
+        e2m3u2bouquet.CFGPATH = os.path.join(tmp, 'e2m3u2bouquet')
+        os.makedirs(os.path.join(e2m3u2bouquet.CFGPATH, 'epg'))
+        config = e2m3u2bouquet.ProviderConfig()
+        config.name = 'Benchmark'
+        config.m3u_url = 'file://' + playlist
+        config.epg_url = 'http://epg.example.com/xmltv.xml'
+        provider = e2m3u2bouquet.Provider(config)
+        start = time.time()
+        provider.download_m3u()
+        return time.time() - start, sum(len(channels) for channels in provider._dictchannels.values())
+    finally:
+        shutil.rmtree(tmp)
+
+
+def run_download(name, tree, playlist, lines):
+    out = subprocess.check_output([sys.executable, os.path.realpath(__file__), '--child', tree, playlist],
+                                  stderr=open(os.devnull, 'wb'))
+    elapsed, count = out.split()[-2:]
+    elapsed = float(elapsed)
+    print('{:<14} {:>8} services {:>8.3f}s {:>12.0f} lines/s'.format(name, count, elapsed, lines / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='M3U parse benchmark')
+    parser.add_argument('entries', type=int, nargs='?', default=120000)
+    parser.add_argument('--vod-ratio', type=float, default=0.2, help='share of VOD entries')
+    parser.add_argument('--compare', help='checkout whose download_m3u is also measured')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.stdout = open(os.devnull, 'wb')
+        elapsed, count = download_m3u(*args.child)
+        sys.stdout = sys.__stdout__
+        print('{} {}'.format(elapsed, count))
+        return
+
+    data = make_playlist(args.entries, vod_ratio=args.vod_ratio)
+    lines = data.count(b'\n')
+    print('playlist: {} entries, {} lines, {:.1f} MB'.format(args.entries, lines, len(data) / 1048576.0))
+    run('legacy', legacy_parse, data, lines)
+    run('tokenizer', tokenizer_parse, data, lines)
+
+    fd, playlist = tempfile.mkstemp(suffix='.m3u')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        run_download('download_m3u', ROOT_DIR, playlist, lines)
+        if args.compare:
+            run_download('  --compare', os.path.realpath(args.compare), playlist, lines)
+    finally:
+        os.remove(playlist)
+
+
+if __name__ == '__main__':
+    main()
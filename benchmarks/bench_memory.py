@@ -0,0 +1,85 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Channel memory benchmark: per-channel dict vs slotted Channel records
+
+usage: python2 benchmarks/bench_memory.py [entries]
+"""
+import gc
+import os
+import sys
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import m3uparser
+from channels import Channel, ChannelStore
+from synthetic import make_playlist, iter_chunks
+
+PAGE_SIZE = resource.getpagesize()
+
+
+def rss():
+    gc.collect()
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def service_dict_template():
+    # per-channel dict as it was built in Provider.download_m3u
+    dict = {}.fromkeys(['url-logo', 'url-tvg', 'url-epg', 'tvg-id', 'tvg-name', 'tvg-logo', 'user-agent',
+                        'nameOverride', 'categoryOverride', 'serviceRef', ], '')
+    dict.update({'group-title': 'NoGroup', 'category_type': 'live', 'has_archive': False, 'enabled': True, 'serviceRefOverride': False, })
+    return dict
+
+
+def build_dicts(entries):
+    store = {}
+    for record in entries:
+        service_dict = service_dict_template()
+        service_dict.update(record.attrs)
+        service_dict.update({'stream-name': record.name, 'stream-url': record.url, 'stream-type': '4097',
+                             'serviceRef': '4097:0:1:{:04x}:7412:ae25:1010101:0:0:0'.format(len(store))})
+        store.setdefault(service_dict['group-title'], []).append(service_dict)
+    return store
+
+
+def build_channels(entries):
+    store = ChannelStore()
+    for record in entries:
+        channel = Channel(record.name, record.url,
+                          group_title=record.attrs.get('group-title', 'NoGroup'),
+                          tvg_id=record.attrs.get('tvg-id', ''),
+                          tvg_logo=record.attrs.get('tvg-logo', ''))
+        channel.stream_type = '4097'
+        channel.service_ref = '4097:0:1:{:04x}:7412:ae25:1010101:0:0:0'.format(len(store))
+        store.add(channel)
+    return store
+
+
+def measure(name, builder, data, count):
+    # measure in a forked child so memory freed by the previous builder doesn't hide this one
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+    # the tokenizer yields fresh strings for every entry, as a real download would
+    entries = m3uparser.iter_m3u(iter_chunks(data, m3uparser.CHUNK_SIZE))
+    entries = (r for r in entries if isinstance(r, m3uparser.M3UEntry))
+    before = rss()
+    store = builder(entries)
+    used = rss() - before
+    print('{:<9} {:>8} channels {:>8.1f} MB {:>6} bytes/channel'.format(name, count, used / 1048576.0, used // count))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    data = make_playlist(count, categories=500)
+    measure('dict', build_dicts, data, count)
+    measure('Channel', build_channels, data, count)
+
+
+if __name__ == '__main__':
+    main()
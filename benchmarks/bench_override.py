@@ -0,0 +1,52 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Override benchmark: Provider._parse_map_channels_xml with a large -sort-override.xml
+
+usage: python2 benchmarks/bench_override.py [channels] [categories]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import e2m3u2bouquet
+from synthetic import make_playlist, make_override
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    categories = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    tmp = tempfile.mkdtemp()
+    try:
+        e2m3u2bouquet.CFGPATH = tmp
+        os.makedirs(os.path.join(tmp, 'epg'))
+        playlist = os.path.join(tmp, 'playlist.m3u')
+        with open(playlist, 'wb') as f:
+            f.write(make_playlist(entries, categories))
+        config = e2m3u2bouquet.ProviderConfig()
+        config.name = 'Benchmark'
+        config.m3u_url = 'file://' + playlist
+        config.epg_url = 'http://epg.example.com/xmltv.xml'
+        with open(os.path.join(tmp, 'epg', 'benchmark-sort-override.xml'), 'wb') as f:
+            f.write(make_override(entries, categories))
+
+        provider = e2m3u2bouquet.Provider(config)
+        provider.download_m3u()
+        provider._mapping = provider._load_mapping()
+        provider._category_order = provider._parse_map_bouquet_xml()
+        provider._set_category_type()
+
+        start = time.time()
+        provider._parse_map_channels_xml()
+        elapsed = time.time() - start
+        print('\n_parse_map_channels_xml: {} channels, {} categories: {:.2f}s'.format(entries, categories, elapsed))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
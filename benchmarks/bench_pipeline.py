@@ -0,0 +1,197 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Provider pipeline benchmark: time and peak RSS of every stage of Provider.process_provider
+
+Each playlist size runs in its own process with ENIGMAPATH / CFGPATH / EPGIMPORTPATH /
+CROSSEPGPATH pointed at a temp dir. The playlist is read through the FileAdapter of
+download_m3u from a file:// url and a matching -sort-override.xml is used unless
+--override-every is 0. Nested stages (_parse_map_channels_xml runs in parse_data)
+are indented and included in the stage above them.
+
+The peak RSS of a stage is the VmHWM of the process, reset at the start of every stage
+through /proc/self/clear_refs. Without it (Linux < 4.0) the peak of the whole process
+so far is reported and marked with a '*'.
+
+usage: python2 benchmarks/bench_pipeline.py [-h] [--vod-ratio R] [--categories N] [--tags N]
+                                            [--override-every N] [--verbose] [entries ...]
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from synthetic import make_playlist, make_override, EXTRA_TAGS
+
+STAGES = ('download_m3u', 'parse_data', '_parse_map_channels_xml', 'save_map_xml', 'create_bouquets',
+          'create_epg_config')
+
+
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageMeter(object):
+    """Wall time and peak RSS of (nested) stages in the order they were entered"""
+
+    def __init__(self):
+        self.results = []
+        self.exact = _reset_peak()
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        if self._stack:
+            # the reset below loses the peak of the enclosing stage so far
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], _peak_kb())
+        gc.collect()
+        if self.exact:
+            _reset_peak()
+        frame = {'peak': 0}
+        index = len(self.results)
+        self.results.append(None)
+        self._stack.append(frame)
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            peak = max(frame['peak'], _peak_kb())
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            self.results[index] = {'stage': name, 'depth': len(self._stack), 'seconds': elapsed, 'peak_kb': peak}
+
+    def wrap(self, obj, name):
+        """Measure every call of the method name of obj"""
+        method = getattr(obj, name)
+
+        def measured(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        setattr(obj, name, measured)
+
+
+def run_pipeline(args, result_file):
+    import e2m3u2bouquet
+    # the EPG sources url doesn't need a route to the network
+    e2m3u2bouquet.get_selfip = lambda: '127.0.0.1'
+
+    tmp = tempfile.mkdtemp()
+    try:
+        e2m3u2bouquet.ENIGMAPATH = tmp
+        e2m3u2bouquet.CFGPATH = os.path.join(tmp, 'e2m3u2bouquet')
+        e2m3u2bouquet.EPGIMPORTPATH = os.path.join(tmp, 'epgimport')
+        e2m3u2bouquet.CROSSEPGPATH = os.path.join(tmp, 'crossepg')
+        # EPGImport / CrossEPG are installed on a box
+        for path in (os.path.join(e2m3u2bouquet.CFGPATH, 'epg'), e2m3u2bouquet.EPGIMPORTPATH, e2m3u2bouquet.CROSSEPGPATH):
+            os.makedirs(path)
+        with open(os.path.join(tmp, 'bouquets.tv'), 'wb') as f:
+            f.write('#NAME User - bouquets (TV)\n')
+
+        playlist = os.path.join(tmp, 'playlist.m3u')
+        with open(playlist, 'wb') as f:
+            f.write(make_playlist(args.entries, args.categories, args.vod_ratio, tags=args.tags))
+        if args.override_every:
+            with open(os.path.join(e2m3u2bouquet.CFGPATH, 'epg', 'benchmark-sort-override.xml'), 'wb') as f:
+                f.write(make_override(args.entries, args.categories, args.override_every))
+
+        config = e2m3u2bouquet.ProviderConfig()
+        config.name = 'Benchmark'
+        config.enabled = True
+        config.m3u_url = 'file://' + playlist
+        config.epg_url = 'http://epg.example.com/xmltv.xml'
+        provider = e2m3u2bouquet.Provider(config)
+
+        meter = StageMeter()
+        for name in STAGES:
+            meter.wrap(provider, name)
+        # same order as process_provider
+        provider.download_m3u()
+        provider._mapping = provider._load_mapping()
+        provider.parse_data()
+        provider.parse_map_xmltvsources_xml()
+        provider.save_map_xml()
+        provider.create_bouquets()
+        provider.create_epg_config()
+
+        with open(result_file, 'wb') as f:
+            json.dump({'playlist_bytes': os.path.getsize(playlist), 'exact': meter.exact, 'stages': meter.results}, f)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def run_child(args, entries):
+    """Run the pipeline for entries in a new process, returns its results"""
+    fd, result_file = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        cmd = [sys.executable, os.path.realpath(__file__), '--child', result_file,
+               '--vod-ratio', str(args.vod_ratio), '--categories', str(args.categories),
+               '--tags', str(args.tags), '--override-every', str(args.override_every), str(entries)]
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call(cmd, stdout=None if args.verbose else devnull)
+        with open(result_file, 'rb') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provider pipeline benchmark')
+    parser.add_argument('entries', type=int, nargs='*', default=[1000, 10000, 100000],
+                        help='playlist sizes, 1000 10000 100000 by default')
+    parser.add_argument('--vod-ratio', type=float, default=0.2, help='share of VOD entries')
+    parser.add_argument('--categories', type=int, default=200, help='number of live and VOD categories')
+    parser.add_argument('--tags', type=int, default=4, choices=range(len(EXTRA_TAGS) + 1),
+                        help='extra #EXTINF attributes per entry')
+    parser.add_argument('--override-every', type=int, default=50,
+                        help='override every n-th channel, 0 for no override file')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the pipeline')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.entries = args.entries[0]
+        run_pipeline(args, args.child)
+        return
+
+    print('vod ratio {}, {} categories, {} extra tags, override every {}'.format(
+        args.vod_ratio, args.categories, args.tags, args.override_every or '-'))
+    print('{:>8}  {:<28} {:>10} {:>14}'.format('entries', 'stage', 'time (s)', 'peak RSS (MB)'))
+    for entries in args.entries:
+        result = run_child(args, entries)
+        print('{:>8}  {:<28} {:>10} {:>14}'.format(entries, '(playlist {:.1f} MB)'.format(result['playlist_bytes'] / 1048576.0), '', ''))
+        for stage in result['stages']:
+            print('{:>8}  {:<28} {:>10.2f} {:>13.1f}{}'.format(
+                '', '  ' * stage['depth'] + stage['stage'], stage['seconds'], stage['peak_kb'] / 1024.0,
+                '' if result['exact'] else '*'))
+
+
+if __name__ == '__main__':
+    main()
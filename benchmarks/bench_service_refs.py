@@ -0,0 +1,83 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+Service ref benchmark: per channel md5 + dict of formats vs per category templates
+
+usage: python2 benchmarks/bench_service_refs.py [channels] [categories]
+"""
+import os
+import sys
+import time
+import hashlib
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import e2m3u2bouquet
+from e2m3u2bouquet import NAMESPACE
+from synthetic import make_playlist
+
+
+def legacy_refs(provider):
+    """Service ref loop as it was in Provider.parse_data"""
+    refs = []
+    for cat in provider._dictchannels:
+        num = 34000
+        for x in provider._dictchannels[cat]:
+            cat_id = hashlib.md5(provider.config.name + cat.encode('utf-8')).hexdigest()[:8]
+            service_ref = '{:04x}:{}:{}:{}'.format(num, cat_id[:4].lstrip('0'), cat_id[4:].lstrip('0'), NAMESPACE)
+            refs.append({'1'   : "{}:0:1:{}:0:0:{}".format(x.stream_type, service_ref, provider.config.gstreamer),
+                         '4097': "{}:0:1:{}:0:0:{}".format(x.stream_type, service_ref, provider.config.gstreamer),
+                         '5001': "{}:0:1:{}:0:0:0".format(x.stream_type, service_ref),
+                         '5002': "{}:0:1:{}:0:0:0".format(x.stream_type, service_ref),
+                         }[x.stream_type])
+            num += 1
+    return refs
+
+
+def template_refs(provider):
+    refs = []
+    for cat in provider._dictchannels:
+        num = 34000
+        sref_templates = provider._get_service_ref_templates(cat)
+        for x in provider._dictchannels[cat]:
+            refs.append(sref_templates[x.stream_type].format(num))
+            num += 1
+    return refs
+
+
+def run(name, func, provider, channels):
+    start = time.time()
+    refs = func(provider)
+    elapsed = time.time() - start
+    print('{:<10} {:>8} refs {:>8.3f}s {:>12.0f} channels/s'.format(name, len(refs), elapsed, channels / elapsed))
+    return refs
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    categories = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    tmp = tempfile.mkdtemp()
+    try:
+        playlist = os.path.join(tmp, 'playlist.m3u')
+        with open(playlist, 'wb') as f:
+            f.write(make_playlist(entries, categories))
+        config = e2m3u2bouquet.ProviderConfig()
+        config.name = 'Benchmark'
+        config.m3u_url = 'file://' + playlist
+        config.epg_url = 'http://epg.example.com/xmltv.xml'
+        provider = e2m3u2bouquet.Provider(config)
+        provider.download_m3u()
+        channels = sum(len(x) for x in provider._dictchannels.values())
+        print('\n{} channels, {} categories'.format(channels, len(provider._dictchannels)))
+
+        legacy = run('legacy', legacy_refs, provider, channels)
+        templates = run('templates', template_refs, provider, channels)
+        assert legacy == templates
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic m3u_plus playlists for the benchmarks
+"""
+import random
+
+# optional #EXTINF attributes, the first `tags` of them are added to every entry
+EXTRA_TAGS = (
+    ('tvg-chno', '{0}'),
+    ('tvg-country', 'XX'),
+    ('tvg-language', 'English'),
+    ('tvg-shift', '0'),
+    ('catchup', 'default'),
+    ('catchup-days', '7'),
+    ('timeshift', '1'),
+    ('tvg-url', 'http://epg.example.com/{0}.xml'),
+)
+
+
+def make_playlist(entries=10000, categories=100, vod_ratio=0.0, seed=1, tags=0):
+    """Return the bytes of an m3u_plus playlist with the given number of entries
+
+    tags: number of EXTRA_TAGS attributes per entry
+    """
+    rnd = random.Random(seed)
+    extra = ''.join(' {}="{}"'.format(name, value) for name, value in EXTRA_TAGS[:tags])
+    out = ['#EXTM3U url-tvg="http://epg.example.com/xmltv.php" x-tvg-url="" m3uautoload=1 cache=1500\n']
+    for i in range(entries):
+        cat = 'Category {}'.format(i % categories)
+        if rnd.random() < vod_ratio:
+            url = 'http://stream.example.com:8080/movie/user/pass/{}.mkv'.format(i)
+            cat = 'Movies {}'.format(i % categories)
+        else:
+            url = 'http://stream.example.com:8080/user/pass/{}.ts'.format(i)
+        out.append('#EXTINF:-1 tvg-id="ch{0}.example" tvg-name="Channel {0}"{2} '
+                   'tvg-logo="http://logo.example.com/{0}.png" group-title="{1}",Channel {0}\n'.format(i, cat, extra.format(i)))
+        out.append(url + '\n')
+    return ''.join(out).encode('utf-8')
+
+
+def iter_chunks(data, chunk_size):
+    for pos in range(0, len(data), chunk_size):
+        yield data[pos:pos + chunk_size]
+
+
+def make_override(entries=10000, categories=100, override_every=50, seed=1):
+    """Return the bytes of a -sort-override.xml matching make_playlist(entries, categories)
+
+    Every override_every'th channel is renamed, disabled or moved to another category
+    """
+    rnd = random.Random(seed)
+    out = ['<?xml version="1.0" encoding="utf-8"?>\r\n<mapping>\r\n\t<xmltvextrasources>\r\n\t</xmltvextrasources>\r\n\t<categories>\r\n']
+    for c in range(categories):
+        out.append('\t\t<category name="Category {0}" nameOverride="" idStart="" enabled="true" customCategory="false"/>\r\n'.format(c))
+    out.append('\t</categories>\r\n\t<channels>\r\n')
+    order = list(range(entries))
+    rnd.shuffle(order)
+    for i in sorted(order, key=lambda i: i % categories):
+        cat = 'Category {}'.format(i % categories)
+        name_override = category_override = ''
+        enabled = 'true'
+        if i % override_every == 0:
+            name_override = 'Renamed {}'.format(i)
+            category_override = 'Category {}'.format(rnd.randrange(categories))
+            enabled = 'false' if i % (3 * override_every) == 0 else 'true'
+        out.append('\t\t<channel name="Channel {0}" nameOverride="{1}" tvg-id="ch{0}.example" enabled="{2}" category="{3}" '
+                   'categoryOverride="{4}" serviceRef="" clearStreamUrl="false" />\r\n'
+                   .format(i, name_override, enabled, cat, category_override))
+        if i % (10 * override_every) == 0:
+            out.append('\t\t<channel name="placeholder" category="{}" />\r\n'.format(cat))
+    out.append('\t</channels>\r\n</mapping>')
+    return ''.join(out).encode('utf-8')
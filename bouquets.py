@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Userbouquet rendering
+
+A bouquet is built as a list of text chunks and written to its file with a
+single call. The player parameter suffixes of the 5001/5002 service refs only
+depend on the provider settings, so they are formatted once per provider
+instead of once per service. With reuse set the lines of a service rendered for
+the all channels bouquet are kept until its category bouquet takes them.
+
+BouquetCommit replaces a bouquet file only when its content changed, through
+a temporary file and a rename, so enigma2 never sees a half written bouquet
+and unchanged bouquets are not rewritten to flash. BouquetIndexFile does the
+same for bouquets.tv, it collects the entry changes of all the providers of a
+run and applies them to the file in a single locked read, merge and write at
+the end.
+"""
+
+import os
+import re
+import threading
+
+GROUP_MARKER = '#SERVICE 1:64:0:0:0:0:0:0:0:0:\n'
+URL_SAFE = "!#$%&'()*+,/;=?@[]~"
+URL_PARAMS_SAFE = '!#$%&"()*+,/;=?@[]~'
+
+_ALWAYS_SAFE = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-'
+_QUOTED = dict((chr(i), '%{:02X}'.format(i)) for i in xrange(256))
+
+
+def make_quoter(safe):
+    """Return a urllib.quote(url, safe) equivalent that only touches the characters to escape
+    """
+    unsafe = re.compile('[^{}]'.format(re.escape(_ALWAYS_SAFE + safe)))
+    quote_char = lambda m: _QUOTED[m.group()]
+    return lambda url: unsafe.sub(quote_char, url)
+
+
+class BouquetRenderer(object):
+    def __init__(self, config, hidden_marker, reuse=False):
+        self.hidden_line = hidden_marker + '\n'
+        self.reuse = reuse
+        self._quote = make_quoter(URL_SAFE)
+        self._quote_params = make_quoter(URL_PARAMS_SAFE)
+        self._services = {}
+        player_property = vars(config)
+        self._params = {
+            '5001': '#sapp_ring_buffer_maxsize={ring_buffer_maxsize}&sapp_buffer_size={buffer_size}&sapp_buffer_duration={buffer_duration}'.format(**player_property),
+            '5002': '#sapp_flv2mpeg4={flv2mpeg4}&sapp_progressive={progressive}&sapp_live_ts={live_ts}'.format(**player_property),
+        }
+
+    @staticmethod
+    def header(name):
+        """Start a bouquet buffer"""
+        return ['#NAME {}\n'.format(name)]
+
+    def hidden(self, lines, count):
+        """Add count place holder services (for channel numbering)"""
+        if count > 0:
+            lines.append(self.hidden_line * count)
+
+    def pad(self, lines, channel_num):
+        """Fill up with place holder services to the next multiple of 100, returns the new channel number"""
+        count = -channel_num % 100
+        self.hidden(lines, count)
+        return channel_num + count
+
+    @staticmethod
+    def group(lines, title):
+        """Group description placeholder"""
+        lines.append('{}#DESCRIPTION {}\n'.format(GROUP_MARKER, title))
+
+    def service(self, lines, channel):
+        """Add a channel, place holder channels become hidden services"""
+        if channel.is_placeholder:
+            lines.append(self.hidden_line)
+            return
+
+        if not self.reuse:
+            lines.append(self._render_service(channel))
+            return
+        # a service is in the all channels bouquet and one category bouquet, the second use frees it
+        rendered = self._services.pop(channel, None)
+        if rendered is None:
+            rendered = self._services[channel] = self._render_service(channel)
+        lines.append(rendered)
+
+    def _render_service(self, channel):
+        title = channel.title
+        reftype = channel.service_ref.split(':', 1)[0]
+        if reftype in ('1', '4097'):
+            url = self._quote(channel.stream_url)
+        elif reftype in self._params:
+            params = self._params[reftype]
+            if channel.user_agent:
+                params += '&User-Agent={}'.format(channel.user_agent)
+            url = self._quote_params(channel.stream_url + params)
+        else:
+            return '#DESCRIPTION {}\n'.format(title)
+        return '#SERVICE {}:{}:{}\n#DESCRIPTION {}\n'.format(channel.service_ref, url, title, title)
+
+
+def _replace_file(path, data):
+    """Write data to path through a synced temporary file and a rename"""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(path + '.tmp', path)
+
+
+class BouquetCommit(object):
+    """Diff aware writer of the bouquet files starting with prefix in directory
+
+    Files of a previous run that are not written again are removed by finish()
+    """
+
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        self.bytes_written = 0
+        self.written = []
+        self.unchanged = []
+        self.removed = []
+        self._names = set()
+
+    def write(self, path, lines):
+        """Write a rendered bouquet unless the file already has this content"""
+        data = ''.join(lines)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self._names.add(os.path.basename(path))
+
+        if os.path.isfile(path) and os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    self.unchanged.append(path)
+                    return
+
+        _replace_file(path, data)
+        self.bytes_written += len(data)
+        self.written.append(path)
+
+    def finish(self):
+        """Remove the stale bouquets (and temporary files of an interrupted run)"""
+        for fname in os.listdir(self.directory):
+            if fname.startswith(self.prefix) and fname not in self._names:
+                os.remove(os.path.join(self.directory, fname))
+                if not fname.endswith('.tmp'):
+                    self.removed.append(os.path.join(self.directory, fname))
+
+    def summary(self):
+        return '{} bouquets written ({} bytes), {} unchanged, {} removed'.format(
+            len(self.written), self.bytes_written, len(self.unchanged), len(self.removed))
+
+
+class BouquetIndexFile(object):
+    """bouquets.tv transaction shared by the providers of a run
+
+    The changes are recorded and replayed by commit() on the file as it is at
+    that time, so runs started from the GUI and the scheduler don't drop each
+    other's entries
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._lines = self._read().splitlines(True)
+        self._changes = []
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except IOError:
+            return ''
+
+    def _change(self, change):
+        """Record change (a function of the index lines), returns True if it changes the index
+        """
+        self._changes.append(change)
+        lines = change(self._lines)
+        changed = lines != self._lines
+        self._lines = lines
+        return changed
+
+    def set_provider(self, provider_filename, iptv_bouquets, bouquet_top=False):
+        """Replace the entries of a provider, returns True if the index changed
+        """
+        if not iptv_bouquets:
+            return False
+        provider_marker = '.e2m3u2b_iptv_{}_'.format(provider_filename)
+
+        def change(lines):
+            # Get all the bouquet indexes except this provider
+            current_bouquet_indexes = [l for l in lines if not (l.startswith('#NAME') or provider_marker in l)]
+            if bouquet_top:
+                return ['#NAME Bouquets (TV)\n'] + iptv_bouquets + current_bouquet_indexes
+            return ['#NAME Bouquets (TV)\n'] + current_bouquet_indexes + iptv_bouquets
+        return self._change(change)
+
+    def remove(self, is_removed):
+        """Remove the entries for which is_removed(line) is true, returns True if the index changed
+        """
+        return self._change(lambda lines: [l for l in lines if not is_removed(l)])
+
+    def commit(self):
+        """Write bouquets.tv if its content changed, returns True if it was written
+        """
+        if not self._changes:
+            return False
+        with self._lock:
+            original = self._read()
+            lines = original.splitlines(True)
+            for change in self._changes:
+                lines = change(lines)
+            self._changes = []
+            self._lines = lines
+            data = ''.join(lines)
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            if data == original:
+                return False
+            _replace_file(self.path, data)
+        return True
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Compact channel records
+
+Six figure VOD playlists produce as many channels, so a channel is a slotted
+object instead of a per-channel dict and the repeated strings (group titles,
+stream and category types) are shared through the store intern table.
+"""
+
+from collections import OrderedDict
+
+
+class Channel(object):
+    __slots__ = ('stream_name', 'stream_url', 'stream_type', 'group_title', 'category_type',
+                 'tvg_id', 'tvg_logo', 'user_agent', 'name_override', 'category_override',
+                 'service_ref', 'service_ref_override', 'enabled')
+
+    def __init__(self, stream_name, stream_url='', group_title='NoGroup', tvg_id='', tvg_logo='', user_agent=''):
+        self.stream_name = stream_name
+        self.stream_url = stream_url
+        self.stream_type = ''
+        self.group_title = group_title
+        self.category_type = 'live'
+        self.tvg_id = tvg_id
+        self.tvg_logo = tvg_logo
+        self.user_agent = user_agent
+        self.name_override = ''
+        self.category_override = ''
+        self.service_ref = ''
+        self.service_ref_override = False
+        self.enabled = True
+
+    @property
+    def is_placeholder(self):
+        return self.stream_name.startswith('placeholder_')
+
+    @property
+    def title(self):
+        """Return the title override if set else the title
+        """
+        return self.name_override or self.stream_name
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+
+class ChannelStore(OrderedDict):
+    """Category -> [Channel] in playlist order"""
+
+    def __init__(self, *args, **kwargs):
+        OrderedDict.__init__(self, *args, **kwargs)
+        self._strings = {}
+
+    def intern(self, value):
+        """Return the shared copy of a repeated string"""
+        return self._strings.setdefault(value, value)
+
+    def add(self, channel):
+        channel.group_title = self.intern(channel.group_title)
+        channel.stream_type = self.intern(channel.stream_type)
+        channel.category_type = self.intern(channel.category_type)
+        self.setdefault(channel.group_title, []).append(channel)
+
+
+class ChannelIndex(object):
+    """Stream name lookup over a ChannelStore
+
+    Per category name maps are built on first use. Channels with the same name
+    keep their list order, so first() returns what a linear search would.
+    Moved channels are only marked in the source category until compact().
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._names = {}
+        self._removed = {}
+
+    def _category(self, cat):
+        names = self._names.get(cat)
+        if names is None:
+            names = self._names[cat] = {}
+            removed = self._removed.get(cat, ())
+            for channel in self._store.get(cat, ()):
+                if id(channel) not in removed:
+                    names.setdefault(channel.stream_name, []).append(channel)
+        return names
+
+    def first(self, cat, name):
+        channels = self._category(cat).get(name)
+        return channels[0] if channels else None
+
+    def move(self, name, src, dst):
+        """Move the first channel called name from category src to the end of dst"""
+        if src == dst or dst not in self._store:
+            return None
+        channels = self._category(src).get(name)
+        if not channels:
+            return None
+        # built before the store changes, else it would already list the channel
+        dst_names = self._category(dst)
+        channel = channels.pop(0)
+        self._removed.setdefault(src, set()).add(id(channel))
+        removed = self._removed.get(dst)
+        if removed and id(channel) in removed:
+            # moved back to a category it is still listed in
+            removed.discard(id(channel))
+        else:
+            self._store[dst].append(channel)
+        dst_names.setdefault(name, []).append(channel)
+        return channel
+
+    def compact(self, cat=None):
+        """Drop the moved channels from the category lists (all if cat is None)"""
+        for key in ([cat] if cat is not None else self._removed.keys()):
+            removed = self._removed.pop(key, None)
+            if removed:
+                channels = self._store[key]
+                channels[:] = [x for x in channels if id(x) not in removed]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+EPG channels file writer
+
+The e2m3u2b_iptv_<provider>_channels.xml.gz file read by EPGImport and
+CrossEPG is fed to one gzip compressor in batches of lines instead of a write
+per channel. The compressed stream goes straight to a temporary file and is
+hashed on the way. The gzip header carries no file name and no time stamp, so
+the same channels always give the same bytes and an unchanged file is not
+replaced on every run.
+"""
+
+import os
+import gzip
+import hashlib
+
+COMPRESS_LEVEL = 6
+BATCH_LINES = 1000
+READ_SIZE = 64 * 1024
+
+
+class _HashingFile(object):
+    """Write-only file that keeps the md5 and size of what went through it"""
+
+    def __init__(self, f):
+        self._f = f
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self.md5.update(data)
+        self.size += len(data)
+        self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            md5.update(block)
+    return md5.digest()
+
+
+class ChannelsXmlWriter(object):
+    """Write the gzip compressed channels file at path on close() unless it is unchanged
+
+    Used as a context manager the file is only committed if the block didn't raise
+    """
+
+    def __init__(self, path, level=COMPRESS_LEVEL, batch_lines=BATCH_LINES):
+        self.path = path
+        self.batch_lines = batch_lines
+        self.written = False
+        self._lines = []
+        self._tmp = open(path + '.tmp', 'wb')
+        self._out = _HashingFile(self._tmp)
+        self._gz = gzip.GzipFile(filename='', mode='wb', compresslevel=level, fileobj=self._out, mtime=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.batch_lines:
+            self._flush()
+
+    def _flush(self):
+        data = ''.join(self._lines)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self._gz.write(data)
+        del self._lines[:]
+
+    def abort(self):
+        """Drop the new file, the existing one is left in place"""
+        self._tmp.close()
+        os.remove(self.path + '.tmp')
+
+    def close(self):
+        """Finish the compressed stream and replace the file if its content changed
+        """
+        self._flush()
+        self._gz.close()
+        if (os.path.isfile(self.path) and os.path.getsize(self.path) == self._out.size
+                and _file_md5(self.path) == self._out.md5.digest()):
+            self.abort()
+            return self.written
+        self._tmp.flush()
+        os.fsync(self._tmp.fileno())
+        self._tmp.close()
+        os.rename(self.path + '.tmp', self.path)
+        self.written = True
+        return self.written
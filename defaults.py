@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Defaults shared by e2m3u2bouquet and the plugin settings
+
+plugin.py reads these while enigma2 loads the plugins, this module has no
+dependencies so that doesn't import e2m3u2bouquet and its libraries.
+"""
+
+PICONSPATH = '/usr/share/enigma2/picon/'
+# Concurrent picon downloads
+PICON_WORKERS = 8
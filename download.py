@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable file download
+
+A download is written to <path>.part and only renamed to path once it is
+complete and its container checks out (gzip CRC / length trailer, xz stream
+footer, closing XMLTV tag), so a reader never gets a truncated file. The
+validators of the .part file are kept in the HttpCache and an interrupted
+download continues with a Range / If-Range request on the next run. Chunks
+start at CHUNK_MIN and grow up to CHUNK_MAX while the connection fills them
+quickly.
+"""
+
+import os
+import time
+import zlib
+import gzip
+import struct
+import requests
+
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = 1024 * 1024
+# a chunk read faster than this doubles the chunk size
+CHUNK_FAST = 0.25
+
+XZ_MAGIC = '\xfd7zXZ\x00'
+XZ_FOOTER_MAGIC = 'YZ'
+
+
+class IntegrityError(IOError):
+    pass
+
+
+def _check_gzip(path):
+    try:
+        with gzip.open(path, 'rb') as f:
+            while f.read(CHUNK_MAX):
+                pass
+    except (IOError, EOFError, struct.error, zlib.error), e:
+        raise IntegrityError('Corrupt gzip file {}: {}'.format(path, e))
+
+
+def _check_xz(path):
+    # python 2 has no lzma, check the stream header / footer instead of decompressing
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        f.seek(0, os.SEEK_END)
+        if f.tell() < 24:
+            raise IntegrityError('Truncated xz file {}'.format(path))
+        f.seek(-12, os.SEEK_END)
+        footer = f.read(12)
+    if not header.startswith(XZ_MAGIC) or footer[10:] != XZ_FOOTER_MAGIC \
+            or footer[8:10] != header[6:8] or struct.unpack('<I', footer[:4])[0] != zlib.crc32(footer[4:10]) & 0xffffffff:
+        raise IntegrityError('Corrupt xz file {}'.format(path))
+
+
+def _check_xml(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 1024))
+        tail = f.read().rstrip()
+    if not tail.endswith('>'):
+        raise IntegrityError('Truncated xml file {}'.format(path))
+
+
+def check_integrity(path, name=None):
+    """Raise IntegrityError if the file is not a complete gzip, xz or xml file
+
+    name: file name deciding the format, path by default
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith('\x1f\x8b'):
+        _check_gzip(path)
+    elif magic == XZ_MAGIC:
+        _check_xz(path)
+    elif (name or path).lower().endswith(('.xml', '.xmltv')):
+        _check_xml(path)
+
+
+def _content_start(response):
+    """First byte of a 206 response, None if it isn't a single range"""
+    content_range = response.headers.get('Content-Range', '')
+    try:
+        return int(content_range.split(' ', 1)[1].split('-', 1)[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _copy(response, f):
+    """Copy the raw body to f in adaptive chunks"""
+    chunk_size = CHUNK_MIN
+    while True:
+        start = time.time()
+        data = response.raw.read(chunk_size)
+        if not data:
+            return
+        f.write(data)
+        if len(data) == chunk_size and chunk_size < CHUNK_MAX and time.time() - start < CHUNK_FAST:
+            chunk_size *= 2
+
+
+def download_file(url, path, http_cache, headers=None, timeout=(5, 30)):
+    """Download url to path, resuming an interrupted download
+
+    Returns True if path was replaced, False if the server answered 304 Not Modified
+    Raises requests / IO errors and IntegrityError, a partial download is kept for the next attempt
+    """
+    part_file = path + '.part'
+    request_headers = dict(headers or {})
+    # identity encoding: ranges and the saved bytes are the file itself
+    request_headers['Accept-Encoding'] = 'identity'
+    request_headers.update(http_cache.headers(url, path))
+    request_headers.update(http_cache.resume_headers(url, part_file))
+
+    with requests.get(url, headers=request_headers, timeout=timeout, stream=True, allow_redirects=True, verify=False) as r:
+        if r.status_code == requests.codes.requested_range_not_satisfiable and 'Range' in request_headers:
+            # the .part file is not a prefix of the current file, start over
+            os.remove(part_file)
+            http_cache.forget_part(url)
+            return download_file(url, path, http_cache, headers, timeout)
+        r.raise_for_status()
+        if r.status_code == requests.codes.not_modified:
+            return False
+        resume = r.status_code == requests.codes.partial_content and os.path.isfile(part_file) \
+            and _content_start(r) == os.path.getsize(part_file)
+        if r.status_code == requests.codes.partial_content and not resume:
+            os.remove(part_file)
+            http_cache.forget_part(url)
+            raise IOError('Unexpected range {} for {}'.format(r.headers.get('Content-Range'), url))
+        if not resume:
+            http_cache.start_part(url, r, part_file)
+            http_cache.save()
+        with open(part_file, 'ab' if resume else 'wb') as f:
+            _copy(r, f)
+
+        total = http_cache.content_length(r)
+        size = os.path.getsize(part_file)
+        try:
+            if total is not None and size > total:
+                raise IntegrityError('Download of {} is larger than {} bytes'.format(url, total))
+            if total is not None and size < total:
+                raise IOError('Incomplete download of {}: {} of {} bytes'.format(url, size, total))
+            check_integrity(part_file, url.split('?', 1)[0])
+        except IntegrityError:
+            os.remove(part_file)
+            http_cache.forget_part(url)
+            http_cache.save()
+            raise
+        os.rename(part_file, path)
+        http_cache.store(url, r, path)
+        http_cache.save()
+    return True
@@ -18,14 +18,14 @@ sys.path.insert(0, os.path.join(ROOT_DIR, 'modules'))
 map(lambda x: sys.path.insert(0, x), glob.glob(os.path.join(ROOT_DIR, 'modules', '*.whl')))
 
 import time
-import gzip
 import errno
-import ntplib
+import hashlib
 import requests
+import picons
+import epgfilter
+import override
+import m3uparser
 import threading
-import ctypes, ctypes.util
-import SocketServer
-import SimpleHTTPServer
 try:
     from PIL import Image
     from io import BytesIO
@@ -33,12 +33,22 @@ try:
 except:
     USE_PIL=False
 from slugify import slugify
-from datetime import datetime
-from socket import socket, AF_INET, SOCK_DGRAM
 from collections import OrderedDict
 from requests_file import FileAdapter
+from channels import Channel, ChannelStore, ChannelIndex
+from bouquets import BouquetRenderer, BouquetCommit, BouquetIndexFile
+from channelsxml import ChannelsXmlWriter
+from defaults import PICONSPATH, PICON_WORKERS
+from netinfo import LocalAddress, NetworkUnreachable
+from ntp import NtpClock
+from fileserver import FileServer
+from download import download_file
+from manifest import Manifest, file_hash, config_hash
+from metrics import RunMetrics, MetricsHistory
+from httpcache import HttpCache
+from taskpool import map_ordered
 from requests.utils import requote_uri, re
-from urllib3.packages.six.moves.urllib.parse import parse_qs, urlparse, quote
+from urllib3.packages.six.moves.urllib.parse import parse_qs, urlparse, uses_params
 from urllib3.exceptions import InsecureRequestWarning
 # Suppress the SSL warning from urllib3
 requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
@@ -67,7 +77,6 @@ CFGPATH = os.path.join(ENIGMAPATH, 'e2m3u2bouquet/')
 
 EPGIMPORTPATH = '/etc/epgimport/'
 CROSSEPGPATH = '/usr/crossepg/providers/'
-PICONSPATH = '/usr/share/enigma2/picon/'
 
 # HIDDEN_MARKER = '#SERVICE 1:519:1:0:0:0:0:0:0:0:'
 HIDDEN_MARKER = '#SERVICE 1:832:d:0:0:0:0:0:0:0:'
@@ -76,10 +85,23 @@ NAMESPACE = '1010101'
 PORT = 10001
 DEFAULTEPG = 'http://epg.openboxfan.com/xmltv-t-sd.xml.gz'
 
+# Provider playlists downloaded concurrently and the cap per m3u host
+PROVIDER_WORKERS = 3
+HOST_WORKERS = 2
+# Cap of the concurrent picon downloads (PICON_WORKERS) per logo host
+PICON_HOST_WORKERS = 4
+# Concurrent requests of the EPG file server
+SERVER_WORKERS = 4
+# gzip level of the EPG channels files, 1 (fastest) - 9 (smallest)
+CHANNELS_COMPRESS_LEVEL = 6
+
+# Box address shared by the EPG sources and the web server
+LOCAL_ADDRESS = LocalAddress()
+# System time offset, measured again after ntp.REFRESH seconds
+NTP_CLOCK = NtpClock()
+
 REQHEADERS = {'User-Agent': 'Mozilla/5.0 (SmartHub; SMART-TV; U; Linux/SmartTV; Maple2012) AppleWebKit/534.7 (KHTML, like Gecko) SmartTV Safari/534.7'}
 
-# Global and local m3u playlist TAG's
-TAG_PATTERN = re.compile(r'.*?(url-logo|url-tvg|url-epg|tvg-id|tvg-name|tvg-logo|group-title)=[\'"](.*?)[\'"]')
 # URL-link validation
 ip_middle_octet = u"(?:\.(?:1?\d{1,2}|2[0-4]\d|25[0-5]))"
 ip_last_octet = u"(?:\.(?:[1-9]\d?|1\d\d|2[0-4]\d|25[0-4]))"
@@ -88,8 +110,9 @@ URL_PATTERN = re.compile(
                          u"^"
                          # protocol identifier
                          u"(?:(?:https?|rtsp|rtp|mmp)://)"
-                         # user:pass authentication
-                         u"(?:\S+(?::\S*)?@)?"
+                         # user:pass authentication (bounded by '/' and '@' to avoid
+                         # backtracking over the whole url for every stream line)
+                         u"(?:[^\s/@]+(?::[^\s/@]*)?@)?"
                          u"(?:"
                          u"(?P<private_ip>"
                          # IP address exclusion
@@ -126,13 +149,6 @@ URL_PATTERN = re.compile(
                         )
 
 
-class SimpleServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
-    daemon_threads = True
-    allow_reuse_address = True
-
-    def __init__(self, server_address, RequestHandlerClass):
-        SocketServer.TCPServer.__init__(self, server_address, RequestHandlerClass)
-
 class CLIError(Exception):
     """Generic exception to raise and log different fatal errors."""
     def __init__(self, msg):
@@ -147,28 +163,10 @@ class CLIError(Exception):
 
 def _set_time():
     """ Get NTP time and set system time
+
+    Returns the applied offset in seconds, None if the time was set recently or no server answered
     """
-    c = ntplib.NTPClient()
-    for host in ['pool.ntp.org', 'time.google.com', 'time.cloudflare.com', 'time.apple.com', 'time.nist.gov']:
-        try:
-            response = c.request(host, version=3, port=123)
-        except Exception as e:
-            pass
-        else:
-            time_tuple = time.localtime(response.tx_time)
-            # http://linux.die.net/man/3/clock_settime
-            CLOCK_REALTIME = 0
-
-            class timespec(ctypes.Structure):
-                _fields_ = [('tv_sec', ctypes.c_long),
-                            ('tv_nsec', ctypes.c_long)]
-
-            librt = ctypes.CDLL(ctypes.util.find_library('rt'))
-            ts = timespec()
-            ts.tv_sec = int( time.mktime(datetime( *time_tuple[:6]).timetuple() ))
-            ts.tv_nsec = time_tuple[6] * 1000000 # Millisecond to nanosecond
-            librt.clock_settime(CLOCK_REALTIME, ctypes.byref(ts))
-            return
+    return NTP_CLOCK.sync()
 
 def display_welcome():
     print('\n********************************')
@@ -196,53 +194,107 @@ def make_config_folder():
         if e.errno != errno.EEXIST:
             raise
 
+VOD_PATTERN = re.compile('.*\.(3g2|3gp|3gp2|3gpp|3gpp2|asf|asx|avi|bin|dat|drv|\
+                                 f4v|flv|gtp|h264|m4v|mkv|mod|moov|mov|mpeg|mpg|mts|\
+                                 mpv|rm|rmvb|spl|swf|qt|vcd|vid|vob|webm|wm|wmv|yuv)', re.I)
+
 def url_validate(url):
     """ URL string validation
     """
-    return re.compile(URL_PATTERN).match(url)
+    return URL_PATTERN.match(url)
 
-def uninstaller():
+def url_path(url):
+    """urlparse(url).path of a scheme://host/... url without the urlparse overhead
+    """
+    scheme, sep, rest = url.partition('://')
+    if not sep:
+        return urlparse(url).path
+    # the path runs from the first '/' after the host to the query or fragment
+    end = len(rest)
+    for c in '?#':
+        i = rest.find(c, 0, end)
+        if i >= 0:
+            end = i
+    start = rest.find('/', 0, end)
+    if start < 0:
+        return ''
+    path = rest[start:end]
+    if ';' in path and scheme.lower() in uses_params:
+        i = path.find(';', path.rfind('/'))
+        if i >= 0:
+            path = path[:i]
+    return path
+
+def write_if_changed(path, data):
+    """Write data to path unless the file already has this content, returns True if it was written
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+def uninstaller(keep_providers=()):
     """Clean up routine to remove any previously made changes
+
+    keep_providers: names of the providers whose bouquets and EPG configs are left in place
+    Returns the removed or modified files
     """
+    # provider files are e2m3u2b_iptv_<provider>_<category>.tv / e2m3u2b_iptv_<provider>.conf ...
+    keep = ['e2m3u2b_iptv_{}{}'.format(slugify(name), sep) for name in keep_providers for sep in '_.']
+
+    def is_generated(fname):
+        return 'e2m3u2b_iptv_' in fname and not any(k in fname for k in keep)
+
     Provider._update_status('Uninstaller', 'Running uninstall')
     print(Status.message)
     try:
         # Bouquets
         print('Removing IPTV userbouquets...')
-        map(lambda fname: os.remove(os.path.join(ENIGMAPATH, fname)) if 'userbouquet.e2m3u2b_iptv_' in fname else None, os.listdir(ENIGMAPATH))
+        removed = [os.path.join(ENIGMAPATH, fname) for fname in os.listdir(ENIGMAPATH) if fname.startswith('userbouquet.') and is_generated(fname)]
         # EPG parsers config files
         print('Removing EPG parsers config files...')
-        if os.path.isdir(EPGIMPORTPATH):
-            map(lambda fname: os.remove(os.path.join(EPGIMPORTPATH, fname)) if 'e2m3u2b_iptv_' in fname else None, os.listdir(EPGIMPORTPATH))
-        if os.path.isdir(CROSSEPGPATH):
-            map(lambda fname: os.remove(os.path.join(CROSSEPGPATH, fname)) if 'e2m3u2b_iptv_' in fname else None, os.listdir(CROSSEPGPATH))
+        for path in (EPGIMPORTPATH, CROSSEPGPATH):
+            if os.path.isdir(path):
+                removed.extend(os.path.join(path, fname) for fname in os.listdir(path) if is_generated(fname))
+        map(os.remove, removed)
+        changed = set(removed)
         # bouquets.tv
         print('Removing IPTV bouquets from bouquets.tv...')
-        with open(os.path.join(ENIGMAPATH, 'bouquets.tv'), 'r+') as f:
-            indexes = [l for l in f if not '.e2m3u2b_iptv_' in l]
-            f.seek(0)
-            f.truncate()
-            f.writelines(indexes)
+        bouquets_index = BouquetIndexFile(os.path.join(ENIGMAPATH, 'bouquets.tv'))
+        bouquets_index.remove(lambda l: '.e2m3u2b_iptv_' in l and is_generated(l))
+        if bouquets_index.commit():
+            changed.add(bouquets_index.path)
 
     except Exception:
         print('Unable to uninstall')
         raise
     Provider._update_status('Uninstaller', 'Uninstall complete')
     print(Status.message)
+    return changed
 
 def get_selfip():
-    # connecting to a UDP address doesn't send packets
+    """Return the cached local IP address, raises NetworkUnreachable without a network
+    """
     try:
-        return [(s.connect(('1.1.1.1', 0)), s.getsockname()[0], s.close()) for s in [socket(AF_INET, SOCK_DGRAM)]][0][1]
-    except:
-       Provider._update_status('Network checker', 'Network is unreachable')
-       sys.exit()
+        return LOCAL_ADDRESS.get()
+    except NetworkUnreachable:
+        Provider._update_status('Network checker', 'Network is unreachable')
+        raise
 
 def web_server():
-    os.chdir(os.path.join(CFGPATH, 'epg'))
-    server = threading.Thread(target=SimpleServer((get_selfip(), PORT), SimpleHTTPServer.SimpleHTTPRequestHandler).serve_forever)
-    server.setDaemon(True)
+    """Serve the EPG channels and downloaded EPG files on PORT
+
+    Bound to all the interfaces, so the urls written with the current get_selfip()
+    address keep working when the box address changes
+    """
+    server = FileServer(('', PORT), os.path.join(CFGPATH, 'epg'), workers=SERVER_WORKERS)
     server.start()
+    return server
 
 def get_category_title(cat, category_options):
     """Return the title override if set else the title
@@ -254,19 +306,43 @@ def get_category_title(cat, category_options):
 def get_service_title(channel):
     """Return the title override if set else the title
     """
-    return channel['nameOverride'] if channel.get('nameOverride', False) else channel['stream-name']
+    return channel.title
+
+def reload_bouquets(changed_files=None):
+    """Do the cheapest enigma2 reload that covers the changed files
 
-def reload_bouquets():
-    if not TESTRUN:
-        Provider._update_status('Reload bouquets', 'Reloading bouquets')
+    changed_files: files written or removed by the run, None to reload the service list and the bouquets.
+    The IPTV services only live in the bouquets, so lamedb is only reloaded if it is in changed_files.
+    Returns the reload time in seconds or None if nothing was reloaded
+    """
+    if TESTRUN:
+        return None
+    if changed_files is None:
+        servicelist = bouquets = True
+    else:
+        names = [os.path.basename(path) for path in changed_files]
+        servicelist = any(name.startswith('lamedb') for name in names)
+        bouquets = servicelist or any(name.startswith(('userbouquet.', 'bouquets.')) for name in names)
+    if not bouquets:
+        Provider._update_status('Reload bouquets', 'No bouquet changes, reload skipped')
         print(Status.message)
-        try:
+        return None
+
+    Provider._update_status('Reload bouquets', 'Reloading service list and bouquets' if servicelist else 'Reloading bouquets')
+    print(Status.message)
+    start = time.time()
+    try:
+        if servicelist:
             eDVBDB.getInstance().reloadServicelist()
-            eDVBDB.getInstance().reloadBouquets()
-        except:
-            r = requests.get('http://{}/web/servicelistreload?mode=2'.format(get_selfip()), timeout=5, verify=False) # reload Servicelist & Bouquets
-            r.close()
-        print('bouquets reloaded...')
+        eDVBDB.getInstance().reloadBouquets()
+    except:
+        # OpenWebif on the box itself, mode 0: service list & bouquets, mode 2: bouquets
+        r = requests.get('http://127.0.0.1/web/servicelistreload?mode={}'.format(0 if servicelist else 2), timeout=5, verify=False)
+        r.close()
+    elapsed = time.time() - start
+    Provider._update_status('Reload bouquets', 'Bouquets reloaded in {:.2f}s'.format(elapsed))
+    print(Status.message)
+    return elapsed
 
 def progressbar(count, total, bar_len=50, status=''):
     """ Simple progressbar indicator to stdout output
@@ -303,20 +379,104 @@ def get_parser_args(program_license, program_version_message):
                         help='Create all channels bouquet')
     parser.add_argument('-P', '--picons', dest='picons', action='store_true',
                         help='Automatically download of Picons, this option will slow the execution')
+    parser.add_argument('-pw', '--piconworkers', dest='piconworkers', action='store', type=int, default=PICON_WORKERS,
+                        help='Number of concurrent picon downloads')
     parser.add_argument('-q', '--iconpath', dest='iconpath', action='store',
                         help='Option path to store picons, if not supplied defaults to /usr/share/enigma2/picon/')
     parser.add_argument('-xs', '--xcludesref', dest='xcludesref', action='store_true',
                         help='Disable service ref overriding from override.xml file')
     parser.add_argument('-bt', '--bouquettop', dest='bouquettop', action='store_true',
                         help='Place IPTV bouquets at top')
+    parser.add_argument('-ef', '--epgfilter', dest='epgfilter', action='store_true',
+                        help='Serve a copy of the EPG reduced to the playlist channels')
+    parser.add_argument('-I', '--incremental', dest='incremental', action='store_true',
+                        help='Skip providers whose playlist, override file and settings are unchanged since the last run')
     parser.add_argument('-U', '--uninstall', dest='uninstall', action='store_true',
                         help='Uninstall all changes made by this script')
     parser.add_argument('-V', '--version', action='version', version=program_version_message)
     return parser
 
+def merge_changed_files(changed_files, provider):
+    """Add the files changed by a provider run, None if they are unknown
+    """
+    if changed_files is None or provider.changed_files is None:
+        return None
+    return changed_files | provider.changed_files
+
+def process_providers(providers, incremental=False, workers=PROVIDER_WORKERS, per_host=HOST_WORKERS,
+                      on_start=None):
+    """Process several providers, downloading their playlists concurrently
+
+    Only the download stage runs in a bounded pool with at most per_host downloads
+    per m3u host. The parse, bouquet and EPG config stages run one provider at a
+    time in list order as soon as its download is done, so the bouquet order is the
+    same as a sequential run, and bouquets.tv is written once after the last provider.
+    on_start: called with each Provider when its download begins (in a pool thread)
+    A provider whose run raises is skipped with its error in Provider.error, the
+    entries of the others are still written.
+    Yields each Provider once its entries are added.
+    """
+    def fetch(provider):
+        if on_start:
+            on_start(provider)
+        try:
+            provider.fetch_provider()
+        except Exception, e:
+            return e
+
+    def host(provider):
+        return urlparse(provider.config.m3u_url).hostname
+
+    Status.set_running(True)
+    bouquets_index = BouquetIndexFile(os.path.join(ENIGMAPATH, 'bouquets.tv'))
+    try:
+        for provider, error in map_ordered(fetch, providers, workers, key=host, per_key=per_host):
+            if error is None:
+                try:
+                    provider.build_provider(incremental=incremental, commit=False)
+                    provider.commit_bouquets(bouquets_index)
+                except Exception, e:
+                    error = e
+            if error is not None:
+                provider.run_failed(error)
+            yield provider
+    finally:
+        bouquets_index.commit()
+        Status.set_running(False)
+
 class Status(object):
     is_running = False
     message = ''
+    # provider name -> RunMetrics of its last run
+    metrics = OrderedDict()
+    _running = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def set_running(cls, running):
+        """Providers may run concurrently, is_running stays set until the last one finishes
+        """
+        with cls._lock:
+            cls._running = max(0, cls._running + (1 if running else -1))
+            cls.is_running = cls._running > 0
+
+    @classmethod
+    def set_metrics(cls, metrics):
+        with cls._lock:
+            cls.metrics[metrics.provider] = metrics
+
+    @classmethod
+    def reset_metrics(cls):
+        with cls._lock:
+            cls.metrics = OrderedDict()
+
+    @classmethod
+    def metrics_summary(cls):
+        """Stage timings and counters of the last run of every provider
+        """
+        with cls._lock:
+            runs = cls.metrics.values()
+        return '\n'.join(metrics.summary() for metrics in runs)
 
 class ProviderConfig(object):
     def __init__(self):
@@ -331,8 +491,10 @@ class ProviderConfig(object):
         self.all_bouquet = False
         self.picons = False
         self.icon_path = ''
+        self.picon_workers = PICON_WORKERS
         self.sref_override = False
         self.bouquet_top = False
+        self.epg_filter = False
         # 4097 Gstreamer options (0-no buffering, 1-buffering enabled, 3- http progressive download & buffering enabl )
         self.gstreamer = '0'
         # 5002 ExtEplayer3 options
@@ -350,41 +512,49 @@ class Provider(object):
         self._panel_bouquet = {}
         self._category_order = []
         self._category_options = {}
-        self._dictchannels = OrderedDict()
+        self._dictchannels = ChannelStore()
         self._xmltv_sources_list = {}
+        self._category_ids = {}
+        self._tvg_ids = {}
+        self._mapping = None
+        self._config_digest = None
+        self._playlist_hash = None
+        self._http_cache = None
+        self._epg_file = None
+        self._pending_bouquet_index = None
+        self.changed_files = None
+        self.error = None
         self.config = config
+        self.metrics = RunMetrics(config.name)
 
-    def _download_picon_file(self, service, total):
-
-        count, x = service
-#        logo_url, title = x['tvg-logo'], slugify(get_service_title(x), separator='', replacements=[['&', 'and'], ['+', 'plus'], ['*', 'star']]) # tvg-logo + SNP
-        logo_url, title = x['tvg-logo'], slugify(x['serviceRef'], separator='_', lowercase=False).upper() # tvg-logo + SNR
-
-        # Get the full picon file name with path without ext
-        pfile_name = os.path.join(self.config.icon_path, title)
-
-        if not filter(os.path.isfile, glob.glob(pfile_name + '*')):
-            if DEBUG:
-                print("Picon file doesn't exist downloading\nPiconURL: {}".format(logo_url))
-            try:
-                with requests.get(logo_url, headers=REQHEADERS, timeout=(5,30), verify=False) as r:
-                    r.raise_for_status()
-                    im = Image.open(BytesIO(r.content))
-                    if im.format is None:
-                       raise ValueError('Not valid image format!')
-                    im.thumbnail((220, 132))
-                    if DEBUG:
-                        print('Save picon: {}.{}'.foramt(title, 'png'))
-                    im.convert('RGBA').save('{}.{}'.format(pfile_name, 'png'), format='PNG')
-            except Exception, e:
+    def _save_picon_file(self, result, index, db, now):
+        """Convert a downloaded logo to PNG and record the outcome in the picon db
+        """
+        pfile_name = os.path.join(self.config.icon_path, result.name)
+        try:
+            if result.error:
+                raise result.error
+            if result.content is not None:
+                self.metrics.add('bytes', len(result.content))
+            if result.content is not None and (db.changed(result.name, result.content) or not index.has_picon(result.name)):
                 if DEBUG:
-                    print('Unable to download or convert logo image to PNG\n{}\n'.format(logo_url), repr(e))
-                # create an empty picon so that we don't retry this picon
-                open('{}.{}'.format(pfile_name, 'None'), 'a').close()
+                    print('Save picon: {}.{}'.format(result.name, 'png'))
+                picons.save_picon(result.content, '{}.{}'.format(pfile_name, 'png'))
+                index.add(result.name, 'png')
+                self.metrics.add('files')
+            db.success(result, now)
+        except Exception, e:
+            if DEBUG:
+                print('Unable to download or convert logo image to PNG\n{}\n'.format(result.url), repr(e))
+            db.failure(result, now)
 
-        if not (IMPORTED and DEBUG):
-            # don't output when called from the plugin
-            progressbar(count, total, status='Done')
+        # empty marker of a failed download from older versions, the picon db replaces it
+        if index.get(result.name) == 'None':
+            try:
+                os.remove('{}.{}'.format(pfile_name, 'None'))
+            except OSError:
+                pass
+            index.remove(result.name)
 
     def _parse_panel_bouquet(self):
         """Check providers bouquet for custom service references
@@ -402,44 +572,39 @@ class Provider(object):
                              # only add to dict if a custom service id is present
                              self._panel_bouquet[key] = value
 
-    def _set_streamtypes_vodcats(self, service_dict):
+    def _set_streamtypes_vodcats(self, channel):
         """Set the stream types and VOD categories
         """
-        is_vod = re.search('.*\.(3g2|3gp|3gp2|3gpp|3gpp2|asf|asx|avi|bin|dat|drv|\
-                                 f4v|flv|gtp|h264|m4v|mkv|mod|moov|mov|mpeg|mpg|mts|\
-                                 mpv|rm|rmvb|spl|swf|qt|vcd|vid|vob|webm|wm|wmv|yuv)',\
-                           os.path.splitext(urlparse(service_dict['stream-url']).path)[-1], re.I)
+        is_vod = VOD_PATTERN.search(os.path.splitext(url_path(channel.stream_url))[-1])
 
         if is_vod is None:
-            service_dict['stream-type'] = str(self.config.streamtype_tv) if self.config.streamtype_tv else '4097'
+            channel.stream_type = str(self.config.streamtype_tv) if self.config.streamtype_tv else '4097'
         else:
-            service_dict['category_type'] = 'vod'
-            service_dict['group-title'] = 'VOD - {}'.format(service_dict['group-title'])
-            service_dict['stream-type'] = str(self.config.streamtype_vod) if self.config.streamtype_vod else '4097'
+            channel.category_type = 'vod'
+            channel.group_title = 'VOD - {}'.format(channel.group_title)
+            channel.stream_type = str(self.config.streamtype_vod) if self.config.streamtype_vod else '4097'
 
     def _parse_map_bouquet_xml(self):
         """Check for bouquets within mapping override file and applies if found
         """
         category_order = []
-        mapping_file = self._get_mapping_file()
-        if mapping_file:
+        if self._mapping:
             Provider._update_status(self.config.name, 'Parsing custom bouquet order')
             print(Status.message)
 
             try:
-                tree = ET.parse(mapping_file).getroot()
-                for node in tree.findall(".//category"):
+                for attrib in self._mapping.categories:
                     dictoption = {}
 
-                    category = node.attrib.get('name').decode('utf-8')
-                    cat_title_override = node.attrib.get('nameOverride', '').decode('utf-8')
+                    category = attrib.get('name')
+                    cat_title_override = attrib.get('nameOverride', '')
                     dictoption['nameOverride'] = cat_title_override
-                    dictoption['idStart'] = int(node.attrib.get('idStart', '0')) if node.attrib.get('idStart', '0').isdigit() else 0
-                    dictoption['enabled'] = node.attrib.get('enabled', True) == 'true'
+                    dictoption['idStart'] = int(attrib.get('idStart', '0')) if attrib.get('idStart', '0').isdigit() else 0
+                    dictoption['enabled'] = attrib.get('enabled', True) == 'true'
                     category_order.append(category)
 
                     # If this category is marked as custom and doesn't exist in self._dictchannels then add
-                    if node.attrib.get('customCategory', False) == 'true':
+                    if attrib.get('customCategory', False) == 'true':
                         dictoption['customCategory'] = True
                         if category not in self._dictchannels:
                             self._dictchannels[category] = []
@@ -467,7 +632,7 @@ class Provider(object):
                         self._category_options[cat] = {'nameOverride': '', 'idStart': 0, 'enabled': True,
                                                        'customCategory': False, type: 'live'}
                     # set category type (live/vod) to same as first stream in cat
-                    self._category_options[cat]["type"] = self._dictchannels[cat][0].get("category_type", "live")
+                    self._category_options[cat]["type"] = self._dictchannels[cat][0].category_type
             else:
                 if self._category_options.get(cat) is None:
                     # dictoption
@@ -478,46 +643,39 @@ class Provider(object):
     def _parse_map_channels_xml(self):
         """Check for channels within mapping override file and apply if found
         """
-        mapping_file = self._get_mapping_file()
-        if mapping_file:
+        if self._mapping:
             Provider._update_status(self.config.name, 'Parsing custom channel order, please be patient')
             print(Status.message)
 
             try:
-                tree = ET.parse(mapping_file).getroot()
+                # index the channel nodes in one pass (file order is kept)
+                category_nodes = {}
+                category_override_nodes = {}
+                for name, category, category_override, attrib in self._mapping.channels:
+                    category_nodes.setdefault(category, []).append(name)
+                    if category_override:
+                        category_override_nodes.setdefault(category_override, []).append((name, category))
+
+                name_index = ChannelIndex(self._dictchannels)
                 i = 0
                 for cat in self._dictchannels:
                     if self._category_options[cat].get('type', 'live') == 'live':
                         # Only override live (not vod) streams
                         sortedchannels = []
 
-                        # find channels that are to be moved to this category (categoryOverride)
-                        for node in tree.findall('.//channel[@categoryOverride="{}"]'.format(cat)):
-                            node_name = node.attrib.get('name').decode('utf-8')
-                            category = node.attrib.get('category').decode('utf-8')
-                            channel_index = None
-
-                            # get index of channel in the current category
-                            try:
-                                channel_index = next((self._dictchannels[category].index(item) for item in self._dictchannels[category]
-                                                      if item['stream-name'] == node_name), None)
-                            except KeyError:
-                                pass
+                        # move channels to this category (categoryOverride)
+                        for node_name, category in category_override_nodes.get(cat, ()):
+                            name_index.move(node_name, category, cat)
+                        name_index.compact(cat)
 
-                            if channel_index is not None:
-                                # remove from existing category and add to new
-                                self._dictchannels[cat].append(self._dictchannels[category].pop(channel_index))
+                        listchannels = [x.stream_name for x in self._dictchannels[cat]]
 
-                        listchannels = [x['stream-name'] for x in self._dictchannels[cat]]
-
-                        for node in tree.findall('.//channel[@category="{}"]'.format(cat)):
+                        for node_name in category_nodes.get(cat, ()):
                             # Check for placeholders, give unique name, insert into sorted channels and dictchannels[cat]
-                            node_name = node.attrib.get('name')
-
                             if node_name == 'placeholder':
                                 node_name = 'placeholder_' + str(i)
                                 listchannels.append(node_name)
-                                self._dictchannels[cat].append({'stream-name': node_name})
+                                self._dictchannels[cat].append(Channel(node_name))
                                 i += 1
                             sortedchannels.append(node_name)
 
@@ -527,45 +685,37 @@ class Provider(object):
 
                         # sort the channels by new order
                         channel_order_dict = {channel: index for index, channel in enumerate(listchannels)}
-                        self._dictchannels[cat].sort(key=lambda x: channel_order_dict[x['stream-name']])
+                        self._dictchannels[cat].sort(key=lambda x: channel_order_dict[x.stream_name])
+                name_index.compact()
                 Provider._update_status(self.config.name, 'Custom channel order applied')
                 print(Status.message)
 
                 # apply overrides
-                channel_nodes = tree.iter('channel')
-                for override_channel in channel_nodes:
-                    name = override_channel.attrib.get('name').decode('utf-8')
-                    category = override_channel.attrib.get('category').decode('utf-8')
-                    category_override = override_channel.attrib.get('categoryOverride').decode('utf-8')
-                    channel_index = None
-
+                for name, category, category_override, attrib in self._mapping.channels:
+                    if name == 'placeholder':
+                        continue
+                    x = None
                     if category_override:
                         # check if the channel has been moved to the new category
-                        try:
-                            channel_index = next((self._dictchannels[category_override].index(item) for item in self._dictchannels[category_override]
-                                              if item['stream-name'] == name), None)
-                        except KeyError:
-                            pass
-
-                    channels_list = self._dictchannels.get(category_override) if category_override and channel_index is not None else self._dictchannels.get(category)
-
-                    if channels_list and name != 'placeholder':
-                        for x in channels_list:
-                            if x['stream-name'] == name:
-                                if override_channel.attrib.get('enabled') == 'false':
-                                    x['enabled'] = False
-                                x['nameOverride'] = override_channel.attrib.get('nameOverride', '')
-                                x['categoryOverride'] = override_channel.attrib.get('categoryOverride', '')
-                                # default to current values if attribute doesn't exist
-                                x['tvg-id'] = override_channel.attrib.get('tvg-id', x['tvg-id'])
-                                if override_channel.attrib.get('serviceRef', None) and self.config.sref_override:
-                                    x['serviceRef'] = override_channel.attrib.get('serviceRef', x['serviceRef'])
-                                    x['serviceRefOverride'] = True
-                                # streamUrl no longer output to xml file but we still check and process it
-                                x['stream-url'] = override_channel.attrib.get('streamUrl', x['stream-url'])
-                                if override_channel.attrib.get('clearStreamUrl') == 'true':
-                                    x['stream-url'] = ''
-                                break
+                        x = name_index.first(category_override, name)
+                    if x is None:
+                        x = name_index.first(category, name)
+
+                    if x is not None:
+                        self.metrics.add('channels')
+                        if attrib.get('enabled') == 'false':
+                            x.enabled = False
+                        x.name_override = attrib.get('nameOverride', '')
+                        x.category_override = attrib.get('categoryOverride', '')
+                        # default to current values if attribute doesn't exist
+                        x.tvg_id = attrib.get('tvg-id', x.tvg_id)
+                        if attrib.get('serviceRef', None) and self.config.sref_override:
+                            x.service_ref = attrib.get('serviceRef', x.service_ref)
+                            x.service_ref_override = True
+                        # streamUrl no longer output to xml file but we still check and process it
+                        x.stream_url = attrib.get('streamUrl', x.stream_url)
+                        if attrib.get('clearStreamUrl') == 'true':
+                            x.stream_url = ''
                 Provider._update_status(self.config.name, 'Custom overrides applied')
                 print(Status.message)
             except Exception:
@@ -584,51 +734,24 @@ class Provider(object):
                 break;
         return mapping_file
 
-    def _save_bouquet_entry(self, f, channel):
-        """Add service to userbouquet file
+    def _load_mapping(self):
+        """Parse the mapping override file (or reuse its cached parse) once per run
         """
-        if not channel['stream-name'].startswith('placeholder_'):
-            REFTYPE = channel['serviceRef'].split(':')[0]
-            player_property = vars(self.config)
-            if REFTYPE in ('1', '4097'):
-                f.write('#SERVICE {}:{}:{}\n'.format(channel['serviceRef'], quote(channel['stream-url'], safe="!#$%&'()*+,/;=?@[]~"), get_service_title(channel)))
-            if REFTYPE == '5001':
-                params = '#sapp_ring_buffer_maxsize={ring_buffer_maxsize}&sapp_buffer_size={buffer_size}&sapp_buffer_duration={buffer_duration}'.format(**player_property)
-                if channel.get('user-agent'):
-                    params += '&User-Agent={}'.format(channel['user-agent'])
-                url = quote(channel['stream-url'] + params, safe='!#$%&"()*+,/;=?@[]~')
-                f.write('#SERVICE {}:{}:{}\n'.format(channel['serviceRef'], url, get_service_title(channel)))
-            if REFTYPE == '5002':
-                params = '#sapp_flv2mpeg4={flv2mpeg4}&sapp_progressive={progressive}&sapp_live_ts={live_ts}'.format(**player_property)
-                if channel.get('user-agent'):
-                    params += '&User-Agent={}'.format(channel['user-agent'])
-                url = quote(channel['stream-url'] + params, safe='!#$%&"()*+,/;=?@[]~')
-                f.write('#SERVICE {}:{}:{}\n'.format(channel['serviceRef'], url, get_service_title(channel)))
-
-            f.write('#DESCRIPTION {}\n'.format(get_service_title(channel)))
-        else:
-            f.write('{}\n'.format(HIDDEN_MARKER))
+        mapping_file = self._get_mapping_file()
+        if mapping_file:
+            try:
+                return override.load(mapping_file, os.path.join(CFGPATH, slugify(self.config.name)+'-sort-override.cache'))
+            except Exception:
+                msg = 'Corrupt {} file'.format(mapping_file)
+                print(msg)
+                if DEBUG:
+                    raise
+        return None
 
     def _get_bouquet_index_name(self, cat_filename, provider_filename):
         return ('#SERVICE 1:7:1:0:0:0:0:0:0:0:FROM BOUQUET "userbouquet.e2m3u2b_iptv_{}_{}.tv" ORDER BY bouquet\n'.format(provider_filename, cat_filename))
 
-    def _save_bouquet_index_entries(self, iptv_bouquets):
-        """Add to the main bouquets.tv file
-        """
-        if iptv_bouquets:
-            with open(os.path.join(ENIGMAPATH, 'bouquets.tv'), 'r+') as f:
-                # Get all the bouquet indexes except this provider
-                current_bouquet_indexes = [l for l in f if not any([l.startswith('#NAME'), '.e2m3u2b_iptv_{}'.format(slugify(self.config.name)) in l])]
-                f.seek(0)
-                f.truncate()
-                #f.truncate(0)
-                f.write('#NAME Bouquets (TV)\n')
-                if self.config.bouquet_top:
-                    f.writelines(iptv_bouquets + current_bouquet_indexes)
-                else:
-                    f.writelines(current_bouquet_indexes + iptv_bouquets)
-
-    def _create_all_channels_bouquet(self):
+    def _create_all_channels_bouquet(self, renderer, commit):
         """Create the Enigma2 all channels bouquet
         """
         bouquet_indexes = []
@@ -644,26 +767,24 @@ class Provider(object):
             print("Creating: {}".format(bouquet_filepath))
         Provider._update_status(self.config.name, 'Create all channels bouquet'.format())
 
-        with open(bouquet_filepath, 'w+') as f:
-            f.write('#NAME {} - {}\n'.format(self.config.name, bouquet_name))
-            # write place holder channels (for channel numbering)
-            f.writelines(['{}\n'.format(HIDDEN_MARKER) for i in xrange(100)])
-            channel_num = 1
-
-            for cat in self._category_order:
-                if cat in self._dictchannels:
-                    if cat not in vod_categories:
-                        # Insert group description placeholder in bouquet
-                        f.write('#SERVICE 1:64:0:0:0:0:0:0:0:0:\n')
-                        f.write('#DESCRIPTION {}\n'.format(get_category_title(cat, self._category_options)))
-                        for x in self._dictchannels[cat]:
-                            if x.get('enabled') or x['stream-name'].startswith('placeholder_'):
-                                self._save_bouquet_entry(f, x)
-                            channel_num += 1
-
-                        while (channel_num % 100) is not 0:
-                            f.write('{}\n'.format(HIDDEN_MARKER))
-                            channel_num += 1
+        lines = renderer.header('{} - {}'.format(self.config.name, bouquet_name))
+        # write place holder channels (for channel numbering)
+        renderer.hidden(lines, 100)
+        channel_num = 1
+
+        for cat in self._category_order:
+            if cat in self._dictchannels:
+                if cat not in vod_categories:
+                    # Insert group description placeholder in bouquet
+                    renderer.group(lines, get_category_title(cat, self._category_options))
+                    for x in self._dictchannels[cat]:
+                        if x.enabled or x.is_placeholder:
+                            renderer.service(lines, x)
+                        channel_num += 1
+
+                    channel_num = renderer.pad(lines, channel_num)
+
+        commit.write(bouquet_filepath, lines)
 
         # Add to bouquet index list
         bouquet_indexes.append(self._get_bouquet_index_name(cat_filename, provider_filename))
@@ -671,108 +792,299 @@ class Provider(object):
         print(Status.message)
         return bouquet_indexes
 
+    def _get_channels_url(self):
+        """URL of the channels file served by web_server()
+        """
+        return 'http://{}:{}/e2m3u2b_iptv_{}_channels.xml.gz'.format(get_selfip(), PORT, slugify(self.config.name))
+
     def _create_crossepg_source(self, sources, group=None):
-        """Create CrossEPG source file
+        """Create CrossEPG source file, returns True if it was written
         """
         # Channels list xml
-        channels_filename = 'http://{}:{}/e2m3u2b_iptv_{}_channels.xml.gz'.format(get_selfip(), PORT, slugify(self.config.name))
+        channels_filename = self._get_channels_url()
         # write providers epg feed
         source_filename = os.path.join(CROSSEPGPATH, 'e2m3u2b_iptv_{}.conf'.format(slugify(self.config.name)))
 
-        with open(source_filename, 'w+') as f:
-            f.write('description={}\n'.format(self.config.name))
-            f.write('protocol=xmltv\n')
-            for count, (k, v) in enumerate(sources.iteritems()):
-                f.write('channels_url_{}={}\n'.format(count, channels_filename))
-                f.write('epg_url_{}={}\n'.format(count, v[0]))
-            f.write('preferred_language=eng\n')
+        lines = ['description={}\n'.format(self.config.name),
+                 'protocol=xmltv\n']
+        for count, (k, v) in enumerate(sources.iteritems()):
+            lines.append('channels_url_{}={}\n'.format(count, channels_filename))
+            lines.append('epg_url_{}={}\n'.format(count, v[0]))
+        lines.append('preferred_language=eng\n')
+        return write_if_changed(source_filename, ''.join(lines))
 
     def _create_epgimport_source(self, sources, group=None):
-        """Create EPG-importer source file
+        """Create EPG-importer source file, returns True if it was written
         """
 
         indent = "\t"
         source_name = '{} - {}'.format(slugify(self.config.name, lowercase=False), group) if group else slugify(self.config.name, lowercase=False)
-        channels_filename = 'http://{}:{}/e2m3u2b_iptv_{}_channels.xml.gz'.format(get_selfip(), PORT, slugify(self.config.name))
+        channels_filename = self._get_channels_url()
 
         # write providers epg feed
         source_filename = os.path.join(EPGIMPORTPATH, 'e2m3u2b_iptv_{}.sources.xml'.format(slugify(source_name)))
 
-        with open(source_filename, 'w+') as f:
-            f.write('<?xml version="1.0" encoding="utf-8"?>\r\n')
-            f.write('<!-- Automatically generated by the e2m3u2b for {} -->\n'.format(xml_escape(self.config.name)))
-            f.write('<sources>\n')
-            f.write('{}<sourcecat sourcecatname="IPTV Bouquet Maker/{}">\n'.format(indent, xml_escape(source_name)))
-            for k, v in sources.iteritems():
-                f.write('{}<source type="gen_xmltv" nocheck="1" channels="{}">\n'.format(2 * indent, channels_filename))
-                f.write('{}<description>{}</description>\n'.format(3 * indent, xml_escape(k)))
-                f.write('{}<url>{}</url>\n'.format(3 * indent, v[0]))
-                f.write('{}</source>\n'.format(2 * indent))
-            f.write('{}</sourcecat>\n'.format(indent))
-            f.write('</sources>\n')
+        lines = ['<?xml version="1.0" encoding="utf-8"?>\r\n',
+                 '<!-- Automatically generated by the e2m3u2b for {} -->\n'.format(xml_escape(self.config.name)),
+                 '<sources>\n',
+                 '{}<sourcecat sourcecatname="IPTV Bouquet Maker/{}">\n'.format(indent, xml_escape(source_name))]
+        for k, v in sources.iteritems():
+            lines.append('{}<source type="gen_xmltv" nocheck="1" channels="{}">\n'.format(2 * indent, channels_filename))
+            lines.append('{}<description>{}</description>\n'.format(3 * indent, xml_escape(k)))
+            lines.append('{}<url>{}</url>\n'.format(3 * indent, v[0]))
+            lines.append('{}</source>\n'.format(2 * indent))
+        lines.append('{}</sourcecat>\n'.format(indent))
+        lines.append('</sources>\n')
+        return write_if_changed(source_filename, ''.join(lines))
 
     def _get_category_id(self, cat):
         """Generate 32 bit category id to help make service refs unique"""
-        return requests.auth.hashlib.md5(self.config.name + cat.encode('utf-8')).hexdigest()[:8]
+        cat_id = self._category_ids.get(cat)
+        if cat_id is None:
+            cat_id = self._category_ids[cat] = hashlib.md5(self.config.name + cat.encode('utf-8')).hexdigest()[:8]
+        return cat_id
+
+    def _get_service_ref_templates(self, cat):
+        """Service ref format per stream type for a category, only the SID is left to fill in per channel
+        """
+        #	SID:NS:TSID:ONID:STYPE:UNUSED(channelnumber in enigma1)
+        #	X   X  X    X    D     D
+
+        #	REFTYPE:FLAGS:STYPE:SID:TSID:ONID:NS:PARENT_SID:PARENT_TSID:UNUSED
+        #	D       D     X     X   X    X    X  X          X           X
+
+        #               SID : TID  : ONID : Namespace"
+        #             {:04x}:{:04x}:{:04x}:{:08x}
+        cat_id = self._get_category_id(cat)
+        ref = '{}:{}:{}'.format(cat_id[:4].lstrip('0'), cat_id[4:].lstrip('0'), NAMESPACE)
+        return {'1'   : '1:0:1:{{:04x}}:{}:0:0:{}'.format(ref, self.config.gstreamer),
+                '4097': '4097:0:1:{{:04x}}:{}:0:0:{}'.format(ref, self.config.gstreamer),
+                '5001': '5001:0:1:{{:04x}}:{}:0:0:0'.format(ref),
+                '5002': '5002:0:1:{{:04x}}:{}:0:0:0'.format(ref),
+                }
 
     @staticmethod
     def _update_status(name, message):
         Status.message = '\n[{}]: {}'.format(name, message)
 
-    def process_provider(self):
-        Status.is_running = True
+    def process_provider(self, incremental=False, commit=True):
+        """Run all the provider stages
+
+        incremental: stop after the download if the playlist, override file and settings
+        are unchanged since the last run and its output files are untouched
+        commit: add the bouquets to bouquets.tv, else left to a later commit_bouquets() call
+        """
+        Status.set_running(True)
+        try:
+            self.fetch_provider()
+            self.build_provider(incremental, commit)
+        finally:
+            Status.set_running(False)
 
+    def fetch_provider(self):
+        """Download stage of process_provider, the network bound part of a run
+        """
         # Set picon path
         if self.config.icon_path is None or TESTRUN == 1:
             self.config.icon_path = PICONSPATH
         if self.config.name is None:
             self.config.name = "E2m3u2Bouquet"
+        self.metrics = RunMetrics(self.config.name)
+        Status.set_metrics(self.metrics)
 
         # Requote URL's after user input to prevent the use of invalid characters
         self.config.m3u_url = requote_uri(self.config.m3u_url)
         self.config.epg_url = requote_uri(self.config.epg_url)
 
+        # hash the settings before the run changes them (e.g. epg_url)
+        self._config_digest = config_hash(self.config)
+
         # Download & parse m3u to _dictchannels
-        self.download_m3u()
+        with self.metrics.span('download'):
+            self.download_m3u()
 
+    def build_provider(self, incremental=False, commit=True):
+        """Stages of process_provider after fetch_provider, see process_provider
+        """
+        manifest = Manifest(os.path.join(CFGPATH, slugify(self.config.name)+'-manifest.json'))
         if self._dictchannels:
-            self.parse_data()
-
-            self.parse_map_xmltvsources_xml()
+            mapping_file = self._get_mapping_file()
+            inputs = {'config': self._config_digest,
+                      'playlist': self._playlist_hash,
+                      'override': file_hash(mapping_file) if mapping_file else None}
+            if incremental and manifest.is_current(inputs) and not self._picons_due():
+                Provider._update_status(self.config.name, 'Playlist and settings unchanged, bouquets are up to date')
+                print(Status.message)
+                # the EPG itself may still have changed
+                if self.config.epg_filter and self.config.epg_url:
+                    self.filter_epg()
+                self.changed_files = set()
+                self._save_metrics()
+                return
+
+            with self.metrics.span('parse'):
+                self._mapping = self._load_mapping()
+                self.parse_data()
+                self.parse_map_xmltvsources_xml()
             # save xml mapping - should be after m3u parsing
-            self.save_map_xml()
+            with self.metrics.span('save_map'):
+                self.save_map_xml()
 
             # Download picons
             if self.config.picons:
-                self.download_picons()
+                with self.metrics.span('picons'):
+                    self.download_picons()
             # Create bouquet files
-            self.create_bouquets()
+            with self.metrics.span('bouquets'):
+                self.create_bouquets()
             # Now create custom channels for each bouquet
             Provider._update_status(self.config.name, 'Creating EPGImporter & CrossEPG configs')
             print(Status.message)
-            self.create_epg_config()
+            with self.metrics.span('epg_config'):
+                self.create_epg_config()
             Provider._update_status(self.config.name, 'EPGImporter & CrossEPG configs created')
             print(Status.message)
 
-        Status.is_running = False
+            self.changed_files = manifest.update(inputs, self._get_output_files())
+            manifest.save()
+
+            if commit:
+                self.commit_bouquets()
+
+        self._save_metrics()
+
+    def run_failed(self, error):
+        """Record a run that raised error, the files it changed are unknown
+        """
+        self.error = error
+        self.changed_files = None
+        self._pending_bouquet_index = None
+        Provider._update_status(self.config.name, 'Update failed: {}'.format(error))
+        print(Status.message)
+
+    def _save_metrics(self):
+        """Add the stage spans of this run to the provider metrics history
+        """
+        self.metrics.finish()
+        try:
+            history = MetricsHistory(os.path.join(CFGPATH, slugify(self.config.name)+'-metrics.json'))
+            history.append(self.metrics)
+            history.save()
+        except (IOError, OSError), e:
+            print('Unable to save the run metrics: {}'.format(e))
+        print(self.metrics.summary())
+
+    def commit_bouquets(self, bouquets_index=None):
+        """Add the bouquets created by the last run to bouquets.tv
+
+        bouquets_index: BouquetIndexFile shared by several providers and committed by the caller,
+        if None bouquets.tv is updated right away
+        """
+        iptv_bouquets, self._pending_bouquet_index = self._pending_bouquet_index, None
+        if iptv_bouquets is None:
+            return
+        own_index = bouquets_index is None
+        if own_index:
+            bouquets_index = BouquetIndexFile(os.path.join(ENIGMAPATH, 'bouquets.tv'))
+        if bouquets_index.set_provider(slugify(self.config.name), iptv_bouquets, self.config.bouquet_top):
+            if self.changed_files is not None:
+                self.changed_files.add(bouquets_index.path)
+        if own_index:
+            bouquets_index.commit()
+
+    def _get_output_files(self):
+        """Files written by a provider run (bouquets.tv is shared between providers and not included)
+        """
+        provider_filename = slugify(self.config.name)
+        bouquet_prefix = 'userbouquet.e2m3u2b_iptv_{}_'.format(provider_filename)
+        files = [os.path.join(ENIGMAPATH, fname) for fname in os.listdir(ENIGMAPATH) if fname.startswith(bouquet_prefix)]
+        files.extend([os.path.join(CFGPATH, 'epg', provider_filename+'-sort-current.xml'),
+                      os.path.join(CFGPATH, 'epg', 'e2m3u2b_iptv_{}_channels.xml.gz'.format(provider_filename)),
+                      os.path.join(EPGIMPORTPATH, 'e2m3u2b_iptv_{}.sources.xml'.format(provider_filename)),
+                      os.path.join(CROSSEPGPATH, 'e2m3u2b_iptv_{}.conf'.format(provider_filename))])
+        return files
+
+    def _get_http_cache(self):
+        """Validators of the provider downloads (m3u & EPG)
+        """
+        if self._http_cache is None:
+            self._http_cache = HttpCache(os.path.join(CFGPATH, slugify(self.config.name)+'-http-cache.json'))
+        return self._http_cache
+
+    def _get_epg_file_name(self):
+        return slugify(self.config.name) + '_' + self.config.epg_url[self.config.epg_url.rfind("/")+1:]
 
     def download_epg(self):
         """Get EPG file from link in some cases
+
+        The file is only served by web_server() once it is completely downloaded and checked,
+        an interrupted download is resumed on the next run
+        Returns the local EPG file or None if the download failed
         """
         try:
-            fname = slugify(self.config.name) + '_' + self.config.epg_url[self.config.epg_url.rfind("/")+1:]
-            with requests.get(self.config.epg_url, headers=REQHEADERS, timeout=(5,30), stream=True, allow_redirects=True, verify=False) as epg, \
-                open(os.path.join(CFGPATH, 'epg', fname), 'wb') as f:
-                    epg.raise_for_status()
-                    for chunk in epg.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            fname = self._get_epg_file_name()
+            epg_file = os.path.join(CFGPATH, 'epg', fname)
+            part_file = epg_file + '.part'
+            with self.metrics.span('epg_download'):
+                resumed = os.path.getsize(part_file) if os.path.isfile(part_file) else 0
+                try:
+                    # 304 Not Modified - keep the local copy
+                    if download_file(self.config.epg_url, epg_file, self._get_http_cache(), headers=REQHEADERS):
+                        self.metrics.add('bytes', os.path.getsize(epg_file) - resumed)
+                except Exception:
+                    if os.path.isfile(part_file):
+                        self.metrics.add('bytes', os.path.getsize(part_file) - resumed)
+                    raise
             self.config.epg_url = 'http://{}:{}/{}'.format(get_selfip(), PORT, fname)
+            self._epg_file = epg_file
+            return epg_file
         except Exception, e:
             if DEBUG:
                 raise e
-            pass
+            Provider._update_status(self.config.name, 'EPG download failed: {}'.format(e))
+            print(Status.message)
+
+    def filter_epg(self, channel_ids=None):
+        """Serve a copy of the main EPG with only the channel_ids channels and programmes
+
+        channel_ids: ids of the channels file, None for the ids of the previous run
+        """
+        fname = 'e2m3u2b_iptv_{}_epg.xml.gz'.format(slugify(self.config.name))
+        filtered_file = os.path.join(CFGPATH, 'epg', fname)
+        if channel_ids is None:
+            channel_ids = epgfilter.filtered_ids(filtered_file)
+        epg_file = self._epg_file or self.download_epg()
+        if not epg_file or channel_ids is None:
+            return
+        try:
+            if epgfilter.is_current(epg_file, filtered_file, channel_ids):
+                Provider._update_status(self.config.name, 'Filtered EPG is up to date')
+            else:
+                Provider._update_status(self.config.name, 'Filtering EPG')
+                print(Status.message)
+                with self.metrics.span('epg_filter'):
+                    result = epgfilter.filter_xmltv(epg_file, filtered_file, channel_ids, level=CHANNELS_COMPRESS_LEVEL)
+                    self.metrics.add('channels', result.channels)
+                    self.metrics.add('programmes', result.programmes)
+                    self.metrics.add('files')
+                Provider._update_status(self.config.name, 'EPG filtered: {} channels, {} of {} programmes kept'
+                                        .format(result.channels, result.programmes, result.total_programmes))
+            print(Status.message)
+            self.config.epg_url = 'http://{}:{}/{}'.format(get_selfip(), PORT, fname)
+        except Exception, e:
+            if DEBUG:
+                raise e
+            Provider._update_status(self.config.name, 'EPG filtering failed: {}'.format(e))
+            print(Status.message)
 
     def get_tvgid(self, title):
+        tvg_id = self._tvg_ids.get(title)
+        if tvg_id is None:
+            tvg_id = self._tvg_ids[title] = self._slugify_tvgid(title)
+        return tvg_id
+
+    @staticmethod
+    def _slugify_tvgid(title):
         return slugify(title,
                        replacements=[
                                      ['A1', 'amedia1'], ['A2', 'amedia2'],
@@ -807,76 +1119,81 @@ class Provider(object):
             s = requests.Session()
             s.mount('file://', FileAdapter())
             s.stream = True
+            http_cache = self._get_http_cache()
+            # Local copy of a http(s) playlist, reused when the server answers 304 Not Modified
+            playlist_file = None
+            headers = dict(REQHEADERS)
+            if self.config.m3u_url.startswith(('http://', 'https://')):
+                playlist_file = os.path.join(CFGPATH, slugify(self.config.name)+'-playlist.m3u')
+                headers.update(http_cache.headers(self.config.m3u_url, playlist_file))
             # Get playlist from URL or local m3u M3U ('file:///path/to/file')
-            with s.get(self.config.m3u_url, headers=REQHEADERS, timeout=(5,30), verify=False) as r:
+            r = s.get(self.config.m3u_url, headers=headers, timeout=(5,30), verify=False)
+            if r.status_code == requests.codes.not_modified:
+                r.close()
+                Provider._update_status(self.config.name, 'M3U file not modified, using local copy')
+                print(Status.message)
+                r = s.get('file://' + playlist_file)
+                playlist_file = None
+            elif playlist_file and not http_cache.cacheable(r):
+                # no validators, a local copy would never be reused
+                http_cache.forget(self.config.m3u_url)
+                playlist_file = None
+            with r:
                 r.raise_for_status()
                 Provider._update_status(self.config.name, 'Parsing M3U file')
                 print(Status.message)
 
-                def service_dict_template():
-                    dict = {}.fromkeys(['url-logo', 'url-tvg', 'url-epg', 'tvg-id', 'tvg-name', 'tvg-logo', 'user-agent',
-                                        'nameOverride', 'categoryOverride', 'serviceRef', ], '')
-                    dict.update({'group-title': 'NoGroup', 'category_type': 'live', 'has_archive': False, 'enabled': True, 'serviceRefOverride': False, })
-                    return dict
-
-                service_dict = service_dict_template()
-
-                for line in r.iter_lines():
-                    line = line.decode('utf-8-sig')
-
-                    if line.startswith('#EXTM3U'):
+                playlist_md5 = hashlib.md5()
+
+                def iter_chunks():
+                    copy = open(playlist_file + '.tmp', 'wb') if playlist_file else None
+                    try:
+                        for chunk in r.iter_content(chunk_size=m3uparser.CHUNK_SIZE):
+                            playlist_md5.update(chunk)
+                            self.metrics.add('bytes', len(chunk))
+                            if copy:
+                                copy.write(chunk)
+                            yield chunk
+                    finally:
+                        if copy:
+                            copy.close()
+
+                urllogo = ''
+                # the tokenizer only returns entries with a valid stream url
+                for record in m3uparser.iter_m3u(iter_chunks(), m3uparser.M3UTokenizer(is_url=url_validate)):
+                    if isinstance(record, m3uparser.M3UHeader):
                         # Global M3U TAGs url-tvg|url-epg|url-logo
-                        service_dict.update(dict(TAG_PATTERN.findall(line)))
-                        urllogo = service_dict.get('url-logo', '')
+                        urllogo = record.attrs.get('url-logo', '')
                         if self.config.epg_url == '':
-                            self.config.epg_url = service_dict.get('url-tvg', service_dict.get('url-epg', DEFAULTEPG))
+                            self.config.epg_url = record.attrs.get('url-tvg', record.attrs.get('url-epg', DEFAULTEPG))
                         if not url_validate(self.config.epg_url):
                             self.config.epg_url = DEFAULTEPG
                         if self.config.epg_url.startswith('https://'):
                             self.download_epg()
-                        service_dict = service_dict_template()
                         continue
 
-                    elif line.startswith('#EXTINF:'):
-                        try:
-                            extInfData, name = line.split(',')
-                        except:
-                            extInfData, name = line, None
-
-                        service_dict.update(dict(TAG_PATTERN.findall(extInfData)))
-
-                        if name is None:
-                            name = service_dict.get('tvg-name')
-                            if name == '':
-                                if DEBUG:
-                                    print("No TITLE info found for this service - skip")
-                                continue
-                        service_dict.update({'stream-name': name.strip()})
-
-                        tvglogo = service_dict.get('tvg-logo')
-                        if not url_validate(tvglogo) and url_validate(urllogo):
-                            service_dict.update({'tvg-logo': requests.compat.urljoin(urllogo, tvglogo)})
-                        if self.config.epg_url == DEFAULTEPG:
-                            service_dict.update({'tvg-id': self.get_tvgid(service_dict.get('stream-name'))})
-
-                    elif line.startswith('#EXTGRP:') and name:
-                        if service_dict.get('group-title') == 'NoGroup':
-                            try:
-                                service_dict.update({'group-title': line.split(':')[1].strip()})
-                            except:
-                                pass
-
-                    elif line.startswith('#EXTVLCOPT:') and name:
-                        params = {k:v for k,v in [x.split('=') for x in line.split(':') if '=' in x]}
-                        if 'http-user-agent' in params:
-                            service_dict.update({'user-agent': params.get('http-user-agent').strip()})
-
-                    elif url_validate(line) and name:
-                        service_dict.update({'stream-url': line.strip()})
-                        self._set_streamtypes_vodcats(service_dict)
-                        #Set default name for any blank groups and update channels dict
-                        self._dictchannels.setdefault(service_dict['group-title'].decode('utf-8'), []).append(service_dict)
-                        service_dict = service_dict_template()
+                    channel = Channel(record.name, record.url,
+                                      group_title=record.attrs.get('group-title', 'NoGroup'),
+                                      tvg_id=record.attrs.get('tvg-id', ''),
+                                      tvg_logo=record.attrs.get('tvg-logo', ''),
+                                      user_agent=record.user_agent)
+
+                    if urllogo and not url_validate(channel.tvg_logo) and url_validate(urllogo):
+                        channel.tvg_logo = requests.compat.urljoin(urllogo, channel.tvg_logo)
+                    if self.config.epg_url == DEFAULTEPG:
+                        channel.tvg_id = self.get_tvgid(record.name)
+
+                    self._set_streamtypes_vodcats(channel)
+                    #Set default name for any blank groups and update channels dict
+                    self._dictchannels.add(channel)
+
+                self._playlist_hash = playlist_md5.hexdigest()
+                self.metrics.add('channels', sum(len(channels) for channels in self._dictchannels.itervalues()))
+
+                if playlist_file:
+                    os.rename(playlist_file + '.tmp', playlist_file)
+                    http_cache.store(self.config.m3u_url, r, playlist_file)
+                http_cache.save()
 
             if not self._dictchannels:
                 print("No extended playlist info found. Check m3u url should be 'type=m3u_plus'")
@@ -898,7 +1215,8 @@ class Provider(object):
         self._set_category_type()
 
         # Check for and parse override map
-        self._parse_map_channels_xml()
+        with self.metrics.span('override'):
+            self._parse_map_channels_xml()
 
         # Add Service references
         catstartnum = 34000  # serviceid_start
@@ -916,40 +1234,27 @@ class Provider(object):
                 else:
                     self._category_options[cat] = {"idStart": num}
 
-                for x in self._dictchannels[cat]:
-                    cat_id = self._get_category_id(cat)
-                    #	SID:NS:TSID:ONID:STYPE:UNUSED(channelnumber in enigma1)
-                    #	X   X  X    X    D     D
-
-                    #	REFTYPE:FLAGS:STYPE:SID:TSID:ONID:NS:PARENT_SID:PARENT_TSID:UNUSED
-                    #	D       D     X     X   X    X    X  X          X           X
+                sref_templates = self._get_service_ref_templates(cat)
 
-                    #               SID : TID  : ONID : Namespace"
-                    #             {:04x}:{:04x}:{:04x}:{:08x}
-                    service_ref = '{:04x}:{}:{}:{}'.format(num, cat_id[:4].lstrip('0'), cat_id[4:].lstrip('0'), NAMESPACE)
-
-                    if not x['stream-name'].startswith('placeholder_'):
-                        if self._panel_bouquet and not x.get('serviceRefOverride'):
+                for x in self._dictchannels[cat]:
+                    if not x.is_placeholder:
+                        if self._panel_bouquet and not x.service_ref_override:
                             # check if we have the panels custom service ref
-                            pos = x['stream-url'].rfind('/')
-                            if pos != -1 and (pos + 1 != len(x['stream-url'])):
-                                m3u_stream_file = x['stream-url'][pos + 1:]
+                            pos = x.stream_url.rfind('/')
+                            if pos != -1 and (pos + 1 != len(x.stream_url)):
+                                m3u_stream_file = x.stream_url[pos + 1:]
                                 if m3u_stream_file in self._panel_bouquet:
                                     # have a match use the panels custom service ref
-                                    x['serviceRef'] = "{}:{}".format(x['stream-type'],self._panel_bouquet[m3u_stream_file])
+                                    x.service_ref = "{}:{}".format(x.stream_type, self._panel_bouquet[m3u_stream_file])
                                     continue
 
-                        if not x.get('serviceRefOverride'):
+                        if not x.service_ref_override:
                             # if service ref is not overridden in xml update
-                            x['serviceRef'] = {'1'   : "{}:0:1:{}:0:0:{}".format(x['stream-type'], service_ref, self.config.gstreamer),
-                                               '4097': "{}:0:1:{}:0:0:{}".format(x['stream-type'], service_ref, self.config.gstreamer),
-                                               '5001': "{}:0:1:{}:0:0:0".format(x['stream-type'], service_ref),
-                                               '5002': "{}:0:1:{}:0:0:0".format(x['stream-type'], service_ref),
-                                               }[x['stream-type']]
+                            x.service_ref = sref_templates[x.stream_type].format(num)
 
                         num += 1
                     else:
-                        x['serviceRef'] = HIDDEN_MARKER
+                        x.service_ref = HIDDEN_MARKER
             while catstartnum < num:
                 catstartnum += category_offset
 
@@ -985,6 +1290,7 @@ class Provider(object):
                                     linevals += value.encode("utf-8") + ":"
                             datafile.write("{}\n".format(linevals))
 
+        self.metrics.add('categories', len(self._category_order))
         Provider._update_status(self.config.name, 'M3U successfully parsed')
         print(Status.message)
 
@@ -1003,36 +1309,65 @@ class Provider(object):
             if e.errno != errno.EEXIST:
                 raise
 
+        # Download picons if not VOD and not already on disk or due for a retry / refresh
+        index = picons.PiconIndex(self.config.icon_path)
+        db = self._get_picon_db()
+        now = int(time.time())
+        jobs = OrderedDict()
+        seen = set()
         for cat in self._dictchannels:
-            Provider._update_status(self.config.name, 'Update picons for {}'.format(cat))
-            print(Status.message)
-            # Download picons if not VOD
-            services = [ x for x in self._dictchannels[cat]
-                             if self._category_options[cat].get('type', 'live') == 'live'
-                             and not x['stream-name'].startswith('placeholder_')
-                             and url_validate(x.get('tvg-logo'))]
-            total = len(services)
-            map(lambda x: self._download_picon_file(x, total), enumerate(services, start=1))
+            if self._category_options[cat].get('type', 'live') != 'live':
+                continue
+            for x in self._dictchannels[cat]:
+                if x.is_placeholder or not url_validate(x.tvg_logo):
+                    continue
+#                title = slugify(get_service_title(x), separator='', replacements=[['&', 'and'], ['+', 'plus'], ['*', 'star']]) # tvg-logo + SNP
+                title = slugify(x.service_ref, separator='_', lowercase=False).upper() # tvg-logo + SNR
+                if title not in seen:
+                    seen.add(title)
+                    headers = db.check(title, x.tvg_logo, index.has_picon(title), now)
+                    if headers is not None:
+                        jobs[title] = (title, x.tvg_logo, headers)
+        # entries of removed channels would keep _picons_due() true
+        db.retain(seen)
+
+        total = len(jobs)
+        self.metrics.add('downloads', total)
+        downloader = picons.PiconDownloader(self.config.picon_workers, PICON_HOST_WORKERS, headers=REQHEADERS)
+        try:
+            # network in the pool threads, image conversion and progress here
+            for count, result in enumerate(downloader.fetch(jobs.values()), start=1):
+                self._save_picon_file(result, index, db, now)
+                Provider._update_status(self.config.name, 'Downloading picons {}/{}'.format(count, total))
+                if not (IMPORTED and DEBUG):
+                    # don't output when called from the plugin
+                    progressbar(count, total, status='Done')
+        finally:
+            downloader.close()
+            db.save()
 
         Provider._update_status(self.config.name, 'Picons download completed')
         print(Status.message)
         print('To display picons, you must reboot the device...')
 
+    def _get_picon_db(self):
+        return picons.PiconDB(os.path.join(CFGPATH, slugify(self.config.name)+'-picons.json'))
+
+    def _picons_due(self):
+        """True if picon retries or refreshes are due, an incremental run then goes on to the picon stage
+        """
+        if not (self.config.picons and USE_PIL):
+            return False
+        index = picons.PiconIndex(self.config.icon_path)
+        return self._get_picon_db().due(int(time.time()), index.has_picon)
+
     def parse_map_xmltvsources_xml(self):
         """Check for a mapping override file and parses it if found
         """
         self._xmltv_sources_list = {}
-        mapping_file = self._get_mapping_file()
-        if mapping_file:
-            try:
-                tree = ET.parse(mapping_file).getroot()
-                for group in tree.findall('.//xmltvextrasources/group'):
-                    self._xmltv_sources_list['{} - {}'.format(self.config.name, group.attrib.get('id'))] = [url.text for url in group] # Group-name list
-            except Exception:
-                msg = 'Corrupt {} file'.format(mapping_file)
-                print(msg)
-                if DEBUG:
-                    raise msg
+        if self._mapping:
+            for group_id, urls in self._mapping.xmltv_sources:
+                self._xmltv_sources_list['{} - {}'.format(self.config.name, group_id)] = urls # Group-name list
 
     def save_map_xml(self):
         """Create mapping file"""
@@ -1160,40 +1495,48 @@ class Provider(object):
                         if self._category_options[cat].get('type', 'live') == 'live':
                             f.write('{}<!-- {} -->\r\n'.format(2 * indent, xml_escape(cat)))
                             for x in self._dictchannels[cat]:
-                                if not x['stream-name'].startswith('placeholder_'):
+                                if not x.is_placeholder:
                                     f.write('{}<channel name="{}" nameOverride="{}" tvg-id="{}" enabled="{}" category="{}" categoryOverride="{}" serviceRef="{}" clearStreamUrl="{}" />\r\n'
                                             .format(2 * indent,
-                                                    xml_escape(x['stream-name']),
-                                                    xml_escape(x.get('nameOverride', '')),
-                                                    xml_escape(x['tvg-id']),
-                                                    str(x['enabled']).lower(),
-                                                    xml_escape(x['group-title']),
-                                                    xml_escape(x.get('categoryOverride', '')),
-                                                    xml_escape(x['serviceRef']),'false' if x['stream-url'] else 'true'
+                                                    xml_escape(x.stream_name),
+                                                    xml_escape(x.name_override),
+                                                    xml_escape(x.tvg_id),
+                                                    str(x.enabled).lower(),
+                                                    xml_escape(x.group_title),
+                                                    xml_escape(x.category_override),
+                                                    xml_escape(x.service_ref),'false' if x.stream_url else 'true'
                                                     ))
                                 else:
                                     f.write('{}<channel name="{}" category="{}" />\r\n'.format(2 * indent, 'placeholder', xml_escape(cat)))
 
                 f.write('{}</channels>\r\n'.format(indent))
                 f.write('</mapping>')
+                self.metrics.add('files')
+                self.metrics.add('bytes', f.tell())
 
     def create_bouquets(self):
         """Create the Enigma2 bouquets
         """
         Provider._update_status(self.config.name, 'Creating category bouquets')
         print(Status.message)
-        # clean old bouquets before writing new
-        if self._dictchannels:
-            map(lambda fname: os.remove(os.path.join(ENIGMAPATH, fname)) if 'userbouquet.e2m3u2b_iptv_{}'.format(slugify(self.config.name)) in fname else None, os.listdir(ENIGMAPATH))
+        # the all channels bouquet renders every service a second time
+        renderer = BouquetRenderer(self.config, HIDDEN_MARKER,
+                                   reuse=self.config.multi_vod and self.config.all_bouquet and len(self._category_order) > 1)
+        # only changed bouquets are rewritten, old bouquets not created again are removed at the end
+        commit = BouquetCommit(ENIGMAPATH, 'userbouquet.e2m3u2b_iptv_{}_'.format(slugify(self.config.name)))
         # If the option not to create Multi Bouquets is selected,
         # then create an All bouquet by default and return
         # If the playlist does not contain group-title tags we do not create uesrbouquets
         # and forcibly create all channels bouquet and return
         if not self.config.multi_vod or len(self._category_order) == 1:
-            self._save_bouquet_index_entries(self._create_all_channels_bouquet())
+            self._pending_bouquet_index = self._create_all_channels_bouquet(renderer, commit)
+            commit.finish()
+            self.metrics.add('files', len(commit.written))
+            self.metrics.add('bytes', commit.bytes_written)
+            print(commit.summary())
             return
 
-        iptv_bouquet_list = self._create_all_channels_bouquet() if self.config.multi_vod and self.config.all_bouquet else []
+        iptv_bouquet_list = self._create_all_channels_bouquet(renderer, commit) if self.config.multi_vod and self.config.all_bouquet else []
 
         vod_categories = [cat for cat in self._category_order if self._category_options[cat].get('type', 'live') == 'vod']
         vod_category_output = False
@@ -1221,61 +1564,56 @@ class Provider(object):
                     print("Creating: {}".format(bouquet_filepath))
 
                 if cat not in vod_categories or self.config.multi_vod:
-                    with open(bouquet_filepath, 'w+') as f:
-                        bouquet_name = '{} - {}'.format(self.config.name, cat_title).decode("utf-8")
-                        if self._category_options[cat].get('type', 'live') == 'live':
-                            if cat in self._category_options and self._category_options[cat].get('nameOverride', False):
-                                bouquet_name = self._category_options[cat]['nameOverride'].decode('utf-8')
-                        else:
-                            if 'VOD' in self._category_options and self._category_options['VOD'].get('nameOverride', False):
-                                bouquet_name = '{} - {}'\
-                                    .format(self._category_options['VOD']['nameOverride'].decode('utf-8'),
-                                            cat_title.replace('VOD - ', '').decode("utf-8"))
-                        channel_num = 0
-                        f.write('#NAME {}\n'.format(bouquet_name))
-                        if not channel_number_start_offset_output and not self.config.all_bouquet:
-                            # write place holder services (for channel numbering)
-                            f.writelines(['{}\n'.format(HIDDEN_MARKER) for i in xrange(100)])
-                            channel_number_start_offset_output = True
-                            channel_num += 1
-
-                        for x in self._dictchannels[cat]:
-                            if x.get('enabled') or x['stream-name'].startswith('placeholder_'):
-                                self._save_bouquet_entry(f, x)
-                            channel_num += 1
-
-                        while (channel_num % 100) is not 0:
-                            f.write('{}\n'.format(HIDDEN_MARKER))
-                            channel_num += 1
+                    bouquet_name = '{} - {}'.format(self.config.name, cat_title).decode("utf-8")
+                    if self._category_options[cat].get('type', 'live') == 'live':
+                        if cat in self._category_options and self._category_options[cat].get('nameOverride', False):
+                            bouquet_name = self._category_options[cat]['nameOverride'].decode('utf-8')
+                    else:
+                        if 'VOD' in self._category_options and self._category_options['VOD'].get('nameOverride', False):
+                            bouquet_name = '{} - {}'\
+                                .format(self._category_options['VOD']['nameOverride'].decode('utf-8'),
+                                        cat_title.replace('VOD - ', '').decode("utf-8"))
+                    channel_num = 0
+                    lines = renderer.header(bouquet_name)
+                    if not channel_number_start_offset_output and not self.config.all_bouquet:
+                        # write place holder services (for channel numbering)
+                        renderer.hidden(lines, 100)
+                        channel_number_start_offset_output = True
+                        channel_num += 1
+
+                    for x in self._dictchannels[cat]:
+                        if x.enabled or x.is_placeholder:
+                            renderer.service(lines, x)
+                        channel_num += 1
+
+                    renderer.pad(lines, channel_num)
+                    commit.write(bouquet_filepath, lines)
 
                 elif not vod_category_output and not self.config.multi_vod:
                     # not multivod - output all the vod services in one file
-                    with open(bouquet_filepath, 'w+') as f:
-                        bouquet_name = '{} - VOD'.format(self.config.name).decode('utf-8')
-                        if 'VOD' in self._category_options and self._category_options['VOD'].get('nameOverride', False):
-                            bouquet_name = self._category_options['VOD']['nameOverride'].decode('utf-8')
-
-                        channel_num = 0
-                        f.write('#NAME {}\n'.format(bouquet_name))
-                        if not channel_number_start_offset_output and not self.config.all_bouquet:
-                            # write place holder services (for channel numbering)
-                            f.writelines(['{}\n'.format(HIDDEN_MARKER) for i in xrange(100)])
-                            channel_number_start_offset_output = True
-                            channel_num += 1
-
-                        for vodcat in vod_categories:
-                            if vodcat in self._dictchannels:
-                                # Insert group description placeholder in bouquet
-                                f.write('#SERVICE 1:64:0:0:0:0:0:0:0:0:\n')
-                                f.write('#DESCRIPTION {}\n'.format(vodcat))
-                                for x in self._dictchannels[vodcat]:
-                                    self._save_bouquet_entry(f, x)
-                                    channel_num += 1
-
-                                while (channel_num % 100) is not 0:
-                                    f.write('{}\n'.format(HIDDEN_MARKER))
-                                    channel_num += 1
-                        vod_category_output = True
+                    bouquet_name = '{} - VOD'.format(self.config.name).decode('utf-8')
+                    if 'VOD' in self._category_options and self._category_options['VOD'].get('nameOverride', False):
+                        bouquet_name = self._category_options['VOD']['nameOverride'].decode('utf-8')
+
+                    channel_num = 0
+                    lines = renderer.header(bouquet_name)
+                    if not channel_number_start_offset_output and not self.config.all_bouquet:
+                        # write place holder services (for channel numbering)
+                        renderer.hidden(lines, 100)
+                        channel_number_start_offset_output = True
+                        channel_num += 1
+
+                    for vodcat in vod_categories:
+                        if vodcat in self._dictchannels:
+                            # Insert group description placeholder in bouquet
+                            renderer.group(lines, vodcat)
+                            for x in self._dictchannels[vodcat]:
+                                renderer.service(lines, x)
+                                channel_num += 1
+
+                            channel_num = renderer.pad(lines, channel_num)
+                    commit.write(bouquet_filepath, lines)
+                    vod_category_output = True
 
                 # Add to bouquet index list
                 if cat not in vod_categories or (cat in vod_categories and not vod_bouquet_entry_output):
@@ -1284,7 +1622,11 @@ class Provider(object):
                         vod_bouquet_entry_output = True
 
         # write the bouquets.tv indexes
-        self._save_bouquet_index_entries(iptv_bouquet_list)
+        self._pending_bouquet_index = iptv_bouquet_list
+        commit.finish()
+        self.metrics.add('files', len(commit.written))
+        self.metrics.add('bytes', commit.bytes_written)
+        print(commit.summary())
 
         Provider._update_status(self.config.name, 'Category bouquets created')
         print(Status.message)
@@ -1300,9 +1642,11 @@ class Provider(object):
                 raise
         indent = "\t"
         tvg_check = []
+        channel_ids = set()
 
         if self._dictchannels:
-            with gzip.open(os.path.join(CFGPATH, 'epg', 'e2m3u2b_iptv_{}_channels.xml.gz'.format(slugify(self.config.name))), 'wt') as f:
+            channels_file = os.path.join(CFGPATH, 'epg', 'e2m3u2b_iptv_{}_channels.xml.gz'.format(slugify(self.config.name)))
+            with ChannelsXmlWriter(channels_file, level=CHANNELS_COMPRESS_LEVEL) as f:
                 f.write('<?xml version="1.0" encoding="utf-8"?>\n')
                 f.write('<!-- Automatically generated by the e2m3u2b for {} -->\n'.format(xml_escape(self.config.name)))
                 f.write('<channels>\n')
@@ -1314,24 +1658,38 @@ class Provider(object):
                             f.write('{}<!-- {} -->\n'.format(indent, xml_escape(cat_title)))
 
                             for x in self._dictchannels[cat]:
-                                if x['enabled']:
-                                    tvg_id = x.get('tvg-id')
+                                if x.enabled and not x.is_placeholder:
+                                    title = get_service_title(x)
+                                    tvg_id = x.tvg_id
                                     if tvg_id == '':
                                         tvg_check.append(True)
-                                        tvg_id = self.get_tvgid(get_service_title(x))  # force to default value if tvg-id is empty
+                                        tvg_id = self.get_tvgid(title)  # force to default value if tvg-id is empty
+                                    channel_ids.add(tvg_id)
                                     f.write('{}<channel id="{}">{}:http%3a//example.m3u8</channel> <!-- {} -->\n'
                                             .format(indent, xml_escape(tvg_id),
-                                                       x['serviceRef'].replace(x['stream-type'], '1', 1), # force the epg channels to stream type '1'
-                                                           xml_escape(get_service_title(x))))
+                                                       x.service_ref.replace(x.stream_type, '1', 1), # force the epg channels to stream type '1'
+                                                           xml_escape(title)))
                 f.write('</channels>\n')
+            self.metrics.add('channels', len(channel_ids))
+            self.metrics.add('files', int(f.written))
+
+            # the reduced copy replaces the main EPG
+            if self.config.epg_filter and self.config.epg_url:
+                self.filter_epg(channel_ids)
 
             if any(tvg_check) and self.config.epg_url != DEFAULTEPG:
                 self._xmltv_sources_list.update({'{} - {}'.format(slugify(self.config.name, lowercase=False), 'Default EPG'): [DEFAULTEPG]})
             self._xmltv_sources_list.update({'{} - {}'.format(slugify(self.config.name, lowercase=False), 'Main EPG'): [self.config.epg_url]})
-            # create epg-importer sources file for providers feed
-            self._create_epgimport_source(self._xmltv_sources_list)
-            # create CrossEPG sources file for providers feed
-            self._create_crossepg_source(self._xmltv_sources_list)
+            try:
+                # create epg-importer sources file for providers feed
+                written = self._create_epgimport_source(self._xmltv_sources_list)
+                # create CrossEPG sources file for providers feed
+                written += self._create_crossepg_source(self._xmltv_sources_list)
+                self.metrics.add('files', written)
+            except NetworkUnreachable, e:
+                # the channels url needs the box address, the source files of the last run are kept
+                Provider._update_status(self.config.name, 'EPG source files not written: {}'.format(e))
+                print(Status.message)
 
 class Config(object):
     def __init__(self):
@@ -1373,6 +1731,7 @@ class Config(object):
         <iconpath></iconpath><!-- Location to store picons. Do not fill if using GUI mode -->\r
         <xcludesref>1</xcludesref><!-- Disable service ref overriding from override.xml file (0 or 1) -->\r
         <bouquettop>0</bouquettop><!-- Place IPTV bouquets at top (0 or 1)-->\r
+        <epgfilter>0</epgfilter><!-- Serve the EPG reduced to the playlist channels (0 or 1) -->\r
     </supplier>\r
     <supplier>\r
         <name>Supplier Name 1</name><!-- Supplier Name -->\r
@@ -1394,6 +1753,7 @@ class Config(object):
         <iconpath></iconpath><!-- Location to store picons. Do not fill if using GUI mode -->\r
         <xcludesref>1</xcludesref><!-- Disable service ref overriding from override.xml file (0 or 1) -->\r
         <bouquettop>0</bouquettop><!-- Place IPTV bouquets at top (0 or 1)-->\r
+        <epgfilter>0</epgfilter><!-- Serve the EPG reduced to the playlist channels (0 or 1) -->\r
     </supplier>\r
 </config>""")
 
@@ -1453,6 +1813,8 @@ class Config(object):
                             provider.sref_override = (value == '0') == True
                         if child.tag == 'bouquettop':
                             provider.bouquet_top = (value == '1') == True
+                        if child.tag == 'epgfilter':
+                            provider.epg_filter = (value == '1') == True
 
                 if provider.name:
                     self.providers[provider.name] = provider
@@ -1508,6 +1870,7 @@ class Config(object):
                     f.write('{}<iconpath>{}</iconpath><!-- Location to store picons. Do not fill if using GUI mode -->\r\n'.format(2 * indent, provider.icon_path if provider.icon_path else ''))
                     f.write('{}<xcludesref>{}</xcludesref><!-- Disable service ref overriding from override.xml file (0 or 1) -->\r\n'.format(2 * indent, '0' if provider.sref_override else '1'))
                     f.write('{}<bouquettop>{}</bouquettop><!-- Place IPTV bouquets at top (0 or 1) -->\r\n'.format(2 * indent, '1' if provider.bouquet_top else '0'))
+                    f.write('{}<epgfilter>{}</epgfilter><!-- Serve the EPG reduced to the playlist channels (0 or 1) -->\r\n'.format(2 * indent, '1' if provider.epg_filter else '0'))
                     f.write('{}</supplier>\r\n'.format(indent))
                 f.write('</config>\r\n')
         else:
@@ -1549,10 +1912,8 @@ USAGE
         display_welcome()
 
         if uninstall:
-            # Clean up any existing files
-            uninstaller()
-            # reload bouquets
-            reload_bouquets()
+            # Clean up any existing files and reload bouquets
+            reload_bouquets(uninstaller())
             print("Uninstall only, program exiting ...")
             sys.exit(1)  # Quit here if we just want to uninstall
         else:
@@ -1566,8 +1927,10 @@ USAGE
         args_config.all_bouquet = args.allbouquet
         args_config.picons = args.picons
         args_config.icon_path = args.iconpath
+        args_config.picon_workers = args.piconworkers
         args_config.sref_override = not args.xcludesref
         args_config.bouquet_top = args.bouquettop
+        args_config.epg_filter = args.epgfilter
         args_config.name = args.providername
         args_config.streamtype_tv = args.sttv
         args_config.streamtype_vod = args.stvod
@@ -1577,8 +1940,8 @@ USAGE
             print('E2m3u2bouquet - Command line based setup')
             print('**************************************\n')
             args_provider = Provider(args_config)
-            args_provider.process_provider()
-            reload_bouquets()
+            args_provider.process_provider(incremental=args.incremental)
+            reload_bouquets(args_provider.changed_files)
             display_end_msg()
         else:
             print('\n********************************')
@@ -1587,6 +1950,8 @@ USAGE
             e2m3u2b_config = Config()
             if os.path.isfile(os.path.join(CFGPATH, 'config.xml')):
                 e2m3u2b_config.read_config(os.path.join(CFGPATH, 'config.xml'))
+                changed_files = set()
+                providers = []
 
                 for key, provider_config in e2m3u2b_config.providers.iteritems():
                     if provider_config.enabled:
@@ -1597,12 +1962,15 @@ USAGE
                             print('\n********************************')
                             print('Config based setup - {}'.format(provider_config.name))
                             print('********************************\n')
-                            provider = Provider(provider_config)
-                            provider.process_provider()
+                            provider_config.picon_workers = args.piconworkers
+                            providers.append(Provider(provider_config))
                     else:
                         print('\nProvider: {} is disabled - skipping.........\n'.format(provider_config.name))
 
-                reload_bouquets()
+                for provider in process_providers(providers, incremental=args.incremental):
+                    changed_files = merge_changed_files(changed_files, provider)
+
+                reload_bouquets(changed_files)
                 display_end_msg()
             else:
                 e2m3u2b_config.make_default_config(os.path.join(CFGPATH, 'config.xml'))
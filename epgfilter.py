@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+XMLTV reduction
+
+Provider EPG feeds usually carry many more channels than the playlist. The
+feed is stream parsed with iterparse and only the <channel> / <programme>
+elements of the channel ids listed in the channels file are written to a gzip
+compressed copy, so EPGImport / CrossEPG don't have to parse the rest. Only
+one top level element is held in memory at a time.
+
+Ids are compared case insensitively, like EPGImport does.
+"""
+
+import os
+import gzip
+import json
+import subprocess
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+COMPRESS_LEVEL = 6
+
+
+class XmltvFilterResult(object):
+    __slots__ = ('channels', 'programmes', 'total_programmes')
+
+    def __init__(self):
+        self.channels = 0
+        self.programmes = 0
+        self.total_programmes = 0
+
+
+class _XzPipe(object):
+    """Output of an xz -dc process, close() reports a failed decompression"""
+
+    def __init__(self, path):
+        self._process = subprocess.Popen(['xz', '-dc', path], stdout=subprocess.PIPE, bufsize=-1)
+
+    def read(self, size=-1):
+        return self._process.stdout.read(size)
+
+    def close(self):
+        self._process.stdout.close()
+        if self._process.wait():
+            raise IOError('xz failed to decompress the EPG')
+
+
+def _normalize_ids(channel_ids):
+    return set((i.decode('utf-8') if isinstance(i, str) else i).lower() for i in channel_ids)
+
+
+def open_xmltv(path):
+    """Open a plain, gzip or xz compressed XMLTV file for reading
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith('\x1f\x8b'):
+        return gzip.open(path, 'rb')
+    if magic == '\xfd7zXZ\x00':
+        if lzma is not None:
+            return lzma.LZMAFile(path, 'rb')
+        # no python lzma on the box, decompress with xz
+        return _XzPipe(path)
+    return open(path, 'rb')
+
+
+def _stamp(source, ids):
+    st = os.stat(source)
+    return {'source': [st.st_size, int(st.st_mtime)],
+            'channels': sorted(ids)}
+
+
+def _load_stamp(target):
+    try:
+        with open(target + '.json', 'rb') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def is_current(source, target, channel_ids):
+    """True if target was filtered from this source file with these channel ids
+    """
+    return os.path.isfile(target) and _load_stamp(target) == _stamp(source, _normalize_ids(channel_ids))
+
+
+def filtered_ids(target):
+    """Channel ids target was last filtered with, None if it wasn't
+    """
+    stamp = _load_stamp(target)
+    return stamp['channels'] if stamp else None
+
+
+def _copy_elements(stream, out, ids, result):
+    """Write the root and the top level elements of stream kept by ids to out"""
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = elem
+                attrs = ''.join(' {}="{}"'.format(k, v.replace('&', '&amp;').replace('"', '&quot;').replace('<', '&lt;'))
+                                for k, v in root.items())
+                out.write('<?xml version="1.0" encoding="utf-8"?>\n<{}{}>\n'.format(root.tag, attrs).encode('utf-8'))
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == 'programme':
+            result.total_programmes += 1
+            keep = (elem.get('channel') or '').lower() in ids
+            result.programmes += keep
+        elif elem.tag == 'channel':
+            keep = (elem.get('id') or '').lower() in ids
+            result.channels += keep
+        else:
+            keep = False
+        if keep:
+            elem.tail = '\n'
+            out.write(ET.tostring(elem, encoding='utf-8'))
+        # drop the element, only the root stays in memory
+        root.clear()
+    if root is not None:
+        out.write('</{}>\n'.format(root.tag))
+
+
+def filter_xmltv(source, target, channel_ids, level=COMPRESS_LEVEL):
+    """Write the elements of source for channel_ids to the gzip file target
+
+    Returns a XmltvFilterResult
+    """
+    ids = _normalize_ids(channel_ids)
+    result = XmltvFilterResult()
+    stream = open_xmltv(source)
+    try:
+        try:
+            with open(target + '.tmp', 'wb') as raw:
+                with gzip.GzipFile(filename='', mode='wb', compresslevel=level, fileobj=raw, mtime=0) as out:
+                    _copy_elements(stream, out, ids, result)
+                raw.flush()
+                os.fsync(raw.fileno())
+        finally:
+            stream.close()
+    except:
+        if os.path.exists(target + '.tmp'):
+            os.remove(target + '.tmp')
+        raise
+    os.rename(target + '.tmp', target)
+    with open(target + '.json', 'wb') as f:
+        json.dump(_stamp(source, ids), f)
+    return result
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+EPG file server
+
+Serves the channels and EPG files of CFGPATH/epg to EPGImport / CrossEPG on
+this and other boxes of the LAN. Requests are handled by a fixed number of
+worker threads, file bodies are sent with sendfile(2) when the C library has
+it, Range / If-Range and conditional GETs (If-None-Match, If-Modified-Since)
+are supported, and a client accepting gzip gets the precompressed <name>.gz
+of a requested <name> as is. Only the regular files directly in the root
+directory are served and the process working directory is left alone.
+"""
+
+import os
+import re
+import stat
+import errno
+import Queue
+import ctypes
+import select
+import socket
+import urllib
+import mimetypes
+import threading
+import SocketServer
+import BaseHTTPServer
+from email.utils import parsedate_tz, mktime_tz
+
+WORKERS = 4
+BLOCK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def _load_sendfile():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None, None
+    # 32 bit boxes need sendfile64 for a 64 bit offset
+    for name, off_t in (('sendfile64', ctypes.c_int64), ('sendfile', ctypes.c_long)):
+        func = getattr(libc, name, None)
+        if func is not None:
+            func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(off_t), ctypes.c_size_t]
+            func.restype = ctypes.c_ssize_t
+            return func, off_t
+    return None, None
+
+_sendfile, _off_t = _load_sendfile()
+
+
+def sendfile(out_fd, in_fd, offset, count):
+    """Copy count bytes at offset of in_fd to out_fd in the kernel, returns the bytes sent
+    """
+    sent = _sendfile(out_fd, in_fd, ctypes.byref(_off_t(offset)), count)
+    if sent < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return sent
+
+
+class FileRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version = 'e2m3u2b'
+    # a stalled client must not hold a worker forever
+    timeout = 60
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _open(self):
+        """Return (file, gzip encoded) of the requested file or (None, False)
+        """
+        name = urllib.unquote(self.path.split('?', 1)[0].split('#', 1)[0]).lstrip('/')
+        if not name or name.startswith('.') or '/' in name or '\\' in name or '\0' in name:
+            return None, False
+        path = os.path.join(self.server.root, name)
+        candidates = [(path, False)]
+        if not name.endswith('.gz') and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            candidates.insert(0, (path + '.gz', True))
+        for candidate, encoded in candidates:
+            try:
+                f = open(candidate, 'rb')
+            except IOError:
+                continue
+            if stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+                return f, encoded
+            f.close()
+        return None, False
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            since = parsedate_tz(if_modified_since)
+            return since is not None and mtime <= mktime_tz(since)
+        return False
+
+    def _get_range(self, size, etag, last_modified):
+        """Return the requested (start, end) byte range, None for the whole file or False if unsatisfiable
+        """
+        match = RANGE_PATTERN.match(self.headers.get('Range', '').replace(' ', ''))
+        if not match or not any(match.groups()):
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() not in (etag, last_modified):
+            return None
+        first, last = match.groups()
+        if not first:
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def _serve(self, body):
+        f, encoded = self._open()
+        if f is None:
+            self.send_error(404, 'File not found')
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            mtime = int(st.st_mtime)
+            etag = '"{:x}-{:x}"'.format(mtime, size)
+            last_modified = self.date_time_string(mtime)
+
+            if self._not_modified(etag, mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                return
+
+            byte_range = self._get_range(size, etag, last_modified)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range or (0, size - 1)
+
+            content_type, encoding = mimetypes.guess_type(self.path.split('?', 1)[0])
+            if not encoded and encoding == 'gzip':
+                content_type = 'application/x-gzip'
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', content_type or 'application/octet-stream')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('ETag', etag)
+            self.send_header('Accept-Ranges', 'bytes')
+            if encoded:
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Vary', 'Accept-Encoding')
+            if byte_range:
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, size))
+            self.end_headers()
+            if body:
+                try:
+                    self._send_body(f, start, end - start + 1)
+                except (socket.error, OSError, IOError), e:
+                    # client went away
+                    if getattr(e, 'errno', None) not in (errno.EPIPE, errno.ECONNRESET) and not isinstance(e, socket.timeout):
+                        raise
+                    self.close_connection = 1
+
+    def _send_body(self, f, offset, count):
+        self.wfile.flush()
+        out_fd = self.connection.fileno()
+        if _sendfile is not None:
+            while count > 0:
+                try:
+                    sent = sendfile(out_fd, f.fileno(), offset, min(count, 0x7ffff000))
+                except OSError, e:
+                    if e.errno == errno.EAGAIN:
+                        # the socket has a timeout, so it is non blocking
+                        if not select.select([], [out_fd], [], self.timeout)[1]:
+                            raise socket.timeout('timed out')
+                        continue
+                    if e.errno in (errno.EINVAL, errno.ENOSYS):
+                        break
+                    raise
+                if not sent:
+                    return
+                offset += sent
+                count -= sent
+
+        # no sendfile for this file or socket, copy through user space
+        f.seek(offset)
+        while count > 0:
+            data = f.read(min(count, BLOCK_SIZE))
+            if not data:
+                return
+            self.wfile.write(data)
+            count -= len(data)
+
+
+class FileServer(SocketServer.TCPServer):
+    """HTTP server for the files of root with a pool of worker threads
+    """
+    allow_reuse_address = True
+    request_queue_size = 32
+
+    def __init__(self, server_address, root, workers=WORKERS):
+        self.root = os.path.abspath(root)
+        self._requests = Queue.Queue(workers * 4)
+        SocketServer.TCPServer.__init__(self, server_address, FileRequestHandler)
+        for i in xrange(workers):
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+
+    def process_request(self, request, client_address):
+        # blocks once the queue is full, further clients wait in the listen backlog
+        self._requests.put((request, client_address))
+
+    def _worker(self):
+        while True:
+            request, client_address = self._requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def start(self):
+        """Serve in a daemon thread
+        """
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return t
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP validators for conditional downloads
+
+Keeps the ETag / Last-Modified / Content-Length of the last complete download
+of each URL together with the local copy it was saved to. When the local copy
+is still intact the next request carries If-None-Match / If-Modified-Since and
+a 304 answer lets the caller reuse the local copy instead of transferring the
+playlist or EPG again.
+
+The validators of an unfinished download are kept as well, so it can be
+continued with a Range / If-Range request.
+"""
+
+import os
+import json
+
+
+class HttpCache(object):
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        try:
+            with open(path, 'rb') as f:
+                self._entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def headers(self, url, local_file):
+        """Return the conditional request headers for url
+
+        Nothing is sent unless local_file is the complete copy of the last download
+        """
+        entry = self._entries.get(url)
+        if not entry or entry.get('file') != local_file:
+            return {}
+        try:
+            size = os.path.getsize(local_file)
+        except OSError:
+            return {}
+        if size != entry.get('size'):
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def resume_headers(self, url, part_file):
+        """Return the request headers to continue the download of url into part_file
+        """
+        part = self._entries.get(url, {}).get('part')
+        if not part or part.get('file') != part_file:
+            return {}
+        try:
+            size = os.path.getsize(part_file)
+        except OSError:
+            return {}
+        # If-Range needs a strong ETag or a date
+        etag = part.get('etag')
+        validator = etag if etag and not etag.startswith('W/') else part.get('last_modified')
+        if not size or not validator:
+            return {}
+        return {'Range': 'bytes={}-'.format(size), 'If-Range': validator}
+
+    @staticmethod
+    def cacheable(response):
+        """True if a later request for the same url can be made conditional
+        """
+        return bool(response.headers.get('ETag') or response.headers.get('Last-Modified'))
+
+    @staticmethod
+    def content_length(response):
+        """Size of the complete file of a 200 / 206 response or None if unknown
+        """
+        if response.headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        length = response.headers.get('Content-Length')
+        content_range = response.headers.get('Content-Range')
+        if content_range and '/' in content_range:
+            length = content_range.rsplit('/', 1)[1]
+        return int(length) if length and length.isdigit() else None
+
+    def store(self, url, response, local_file):
+        """Record the validators of a complete 200 response saved to local_file
+        """
+        if not self.cacheable(response):
+            self.forget(url)
+            return
+        size = os.path.getsize(local_file)
+        content_length = self.content_length(response)
+        if content_length is not None and content_length != size:
+            # truncated transfer, don't trust the local copy
+            self.forget(url)
+            return
+        self._entries[url] = {'etag': response.headers.get('ETag'),
+                              'last_modified': response.headers.get('Last-Modified'),
+                              'content_length': content_length,
+                              'size': size,
+                              'file': local_file}
+
+    def start_part(self, url, response, part_file):
+        """Record the validators of a download starting in part_file
+        """
+        if not self.cacheable(response):
+            self.forget_part(url)
+            return
+        self._entries.setdefault(url, {})['part'] = {'etag': response.headers.get('ETag'),
+                                                     'last_modified': response.headers.get('Last-Modified'),
+                                                     'file': part_file}
+
+    def forget_part(self, url):
+        entry = self._entries.get(url)
+        if entry:
+            entry.pop('part', None)
+            if not entry:
+                del self._entries[url]
+
+    def forget(self, url):
+        self._entries.pop(url, None)
+
+    def save(self):
+        with open(self.path + '.tmp', 'wb') as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.rename(self.path + '.tmp', self.path)
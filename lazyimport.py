@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred imports
+
+e2m3u2bouquet pulls in requests, PIL, slugify and the other libraries of
+modules/, which takes seconds on a slow receiver. The plugin and its screens
+refer to it through a LazyModule, so it is only imported on first use (or by
+the background start up) instead of while enigma2 loads the plugins.
+"""
+
+import importlib
+
+
+def import_module(name):
+    """Import a module of this plugin, the package is only known when enigma2 loads it
+    """
+    package = __name__.rpartition('.')[0]
+    if package:
+        return importlib.import_module('.' + name, package)
+    return importlib.import_module(name)
+
+
+class LazyModule(object):
+    """Stand-in for a module imported on the first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def load(self):
+        """Import the module now, returns it"""
+        module = self.__dict__['_module']
+        if module is None:
+            # the import lock serializes concurrent first uses
+            module = self.__dict__['_module'] = import_module(self._name)
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__['_module'] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
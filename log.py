@@ -4,27 +4,152 @@
 # import log
 # print>>log, "Some text"
 # because the log unit looks enough like a file!
+#
+# The last CAPACITY complete lines are kept. print>>log writes a line in
+# several parts, the parts are collected per thread so lines of concurrent
+# threads don't mix. Finished lines go to blocks of BLOCK_LINES lines which are
+# only ever appended to, and the state (blocks, offset of the oldest line in
+# the first block, lines in the last block) is published as one immutable
+# tuple. snapshot() only takes a reference to that tuple, so it is O(1) and
+# lock free, the writers are serialized by a lock. With set_file() the lines
+# also go to a file on disk which is rotated once it grows over max_bytes.
 
+import os
 import sys
-from cStringIO import StringIO
 import threading
+from itertools import islice
+
+CAPACITY = 1000
+BLOCK_LINES = 64
+FILE_MAX_BYTES = 256 * 1024
 
-logfile = StringIO()
-# Need to make our operations thread-safe.
+_capacity = CAPACITY
+_state = ((), 0, 0)
 _lock = threading.Lock()
+_partial = threading.local()
+_logfile = None
 
-def write(data):
+
+class LogFile(object):
+    """Lines appended to path, moved to path.1 once the file is over max_bytes"""
+
+    def __init__(self, path, max_bytes=FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, line):
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, 'a')
+                self._file.write(line)
+                self._file.flush()
+                if self._file.tell() > self.max_bytes:
+                    self._file.close()
+                    self._file = None
+                    os.rename(self.path, self.path + '.1')
+            except (IOError, OSError):
+                # a full or read only disk must not break the caller
+                self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LogSnapshot(object):
+    """The buffered lines at the time of snapshot(), oldest first"""
+    __slots__ = ('_blocks', '_start', '_count')
+
+    def __init__(self, blocks, start, count):
+        self._blocks = blocks
+        self._start = start
+        self._count = count
+
+    def __len__(self):
+        if not self._blocks:
+            return 0
+        return (len(self._blocks) - 1) * BLOCK_LINES + self._count - self._start
+
+    def __iter__(self):
+        last = len(self._blocks) - 1
+        for i, block in enumerate(self._blocks):
+            # later appends to the last block are not part of this snapshot
+            for line in islice(block, self._start if i == 0 else 0, self._count if i == last else None):
+                yield line
+
+
+def _trim(blocks, start, count):
+    """Publish the state, dropping the lines over _capacity"""
+    global _state
+    if blocks:
+        start += max(0, (len(blocks) - 1) * BLOCK_LINES + count - start - _capacity)
+        full = min(start // BLOCK_LINES, len(blocks) - 1)
+        if full:
+            blocks = blocks[full:]
+            start -= full * BLOCK_LINES
+    _state = (blocks, start, count)
+
+
+def _append(line):
     with _lock:
-       if logfile.tell() > 2000:
-           # Do a sort of 2k round robin
-           logfile.reset()
-       logfile.write(data)
+        blocks, start, count = _state
+        if not blocks or count == BLOCK_LINES:
+            blocks += ([],)
+            count = 0
+        blocks[-1].append(line)
+        _trim(blocks, start, count + 1)
+    logfile = _logfile
+    if logfile is not None:
+        logfile.write(line)
+
+
+def write(data):
     sys.stdout.write(data)
+    parts = getattr(_partial, 'parts', None)
+    if parts is None:
+        parts = _partial.parts = []
+    parts.append(data)
+    if '\n' not in data:
+        return
+    lines = ''.join(parts).split('\n')
+    del parts[:]
+    if lines[-1]:
+        parts.append(lines[-1])
+    for line in lines[:-1]:
+        _append(line + '\n')
+
+
+def snapshot():
+    """LogSnapshot of the buffered lines, unchanged by later writes"""
+    return LogSnapshot(*_state)
+
 
 def getvalue():
+    return ''.join(snapshot())
+
+
+def clear():
+    global _state
     with _lock:
-       pos = logfile.tell()
-       head = logfile.read()
-       logfile.reset()
-       tail = logfile.read(pos)
-    return head + tail
+        _state = ((), 0, 0)
+
+
+def set_capacity(lines):
+    """Keep the last `lines` lines"""
+    global _capacity
+    with _lock:
+        _capacity = lines
+        _trim(*_state)
+
+
+def set_file(path, max_bytes=FILE_MAX_BYTES):
+    """Also write the log to path, None to stop"""
+    global _logfile
+    logfile, _logfile = _logfile, LogFile(path, max_bytes) if path else None
+    if logfile is not None:
+        logfile.close()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental M3U playlist tokenizer
+
+Consumes raw playlist bytes chunk by chunk (e.g. requests iter_content) and
+yields typed records. Every line is decoded once and #EXTINF attributes are
+extracted with a single left to right scan, so the cost is linear in the
+playlist size.
+
+m3u example:
+
+#EXTM3U url-tvg="http://tvguide.epg:8000/1234/987654321.xml" url-logo="http://www.logoserver.com/logos/"
+#EXTINF:0 tvg-name="Important Channel" tvg-id="imp-001" tvg-logo="http://pathlogo/logo.jpg" group-title="Top10", Discovery Channel
+#EXTGRP:Top10  (optional derective)
+#EXTVLCOPT:http-user-agent=Mozilla/5.0
+http://167.114.102.27/live/Eem9fNZQ8r_FTl9CXevikA/1461268502/a490ae75a3ec2acf16c9f592e889eb4c.m3u8
+"""
+
+import re
+import codecs
+
+# Global and local m3u playlist TAG's
+TAGS = frozenset(['url-logo', 'url-tvg', 'url-epg', 'tvg-id', 'tvg-name', 'tvg-logo', 'group-title'])
+
+CHUNK_SIZE = 64 * 1024
+
+# key="value" / key='value' / key=value pair or the comma that starts the title
+ATTR_PATTERN = re.compile(r'([\w-]+)=("[^"]*"|\'[^\']*\'|[^\s,]*)|(,)', re.UNICODE)
+
+
+class M3UHeader(object):
+    """#EXTM3U line with the global playlist TAG's"""
+    __slots__ = ('attrs',)
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+
+
+class M3UEntry(object):
+    """One playlist service (#EXTINF + optional directives + stream url)"""
+    __slots__ = ('name', 'attrs', 'user_agent', 'url')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.user_agent = ''
+        self.url = ''
+
+
+def parse_attributes(line, start=0):
+    """Scan key="value" pairs from position start
+
+    Returns (attrs, title) where attrs only holds the known TAGS and title is the
+    text after the first comma outside of a quoted value (None if there is none).
+    A value with an opening quote but no closing one is ignored
+    """
+    attrs = {}
+    for m in ATTR_PATTERN.finditer(line, start):
+        key, value, comma = m.group(1, 2, 3)
+        if comma:
+            return attrs, line[m.end():]
+        if key in TAGS:
+            if value[:1] in (u'"', u"'"):
+                if len(value) < 2 or value[-1] != value[0]:
+                    continue
+                value = value[1:-1]
+            attrs[key] = value
+    return attrs, None
+
+
+class M3UTokenizer(object):
+    """Incremental playlist tokenizer
+
+    feed() accepts byte chunks split at arbitrary positions and yields the
+    M3UHeader / M3UEntry records completed by that chunk
+
+    is_url: check of the stream url line, lines after #EXTINF failing it are
+    skipped until a valid url or the next #EXTINF
+    """
+
+    def __init__(self, encoding='utf-8-sig', is_url=None):
+        self._decoder = codecs.getincrementaldecoder(encoding)('replace')
+        self._is_url = is_url
+        self._tail = u''
+        self._entry = None
+        self.lines = 0
+
+    def feed(self, chunk, final=False):
+        text = self._tail + self._decoder.decode(chunk, final)
+        lines = text.split(u'\n')
+        self._tail = u'' if final else lines.pop()
+        self.lines += len(lines)
+        for line in lines:
+            record = self._parse_line(line.strip())
+            if record is not None:
+                yield record
+
+    def close(self):
+        return self.feed(b'', final=True)
+
+    def _parse_line(self, line):
+        if not line:
+            return None
+
+        if line[0] != u'#':
+            entry = self._entry
+            if entry is None or (self._is_url is not None and not self._is_url(line)):
+                return None
+            entry.url = line
+            self._entry = None
+            return entry
+
+        if line.startswith(u'#EXTINF:'):
+            attrs, name = parse_attributes(line, 8)
+            if name is None:
+                name = attrs.get('tvg-name', u'')
+            name = name.strip()
+            # No TITLE info found for this service - skip
+            self._entry = M3UEntry(name, attrs) if name else None
+
+        elif line.startswith(u'#EXTM3U'):
+            self._entry = None
+            return M3UHeader(parse_attributes(line, 7)[0])
+
+        elif self._entry is not None:
+            if line.startswith(u'#EXTGRP:'):
+                self._entry.attrs.setdefault('group-title', line[8:].strip())
+            elif line.startswith(u'#EXTVLCOPT:http-user-agent='):
+                self._entry.user_agent = line[27:].strip()
+        return None
+
+
+def iter_m3u(chunks, tokenizer=None):
+    """Yield the playlist records from an iterable of byte chunks"""
+    tokenizer = tokenizer or M3UTokenizer()
+    for chunk in chunks:
+        for record in tokenizer.feed(chunk):
+            yield record
+    for record in tokenizer.close():
+        yield record
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Provider run manifest
+
+Content hashes of the inputs of a provider run (playlist, sort-override file
+and ProviderConfig) and of the files it wrote, stored as
+CFGPATH/<provider>-manifest.json. An incremental run compares its inputs with
+the previous ones and stops at the first unchanged stage.
+"""
+
+import os
+import json
+import hashlib
+
+BLOCK_SIZE = 64 * 1024
+
+
+def file_hash(path):
+    """Return the md5 hex digest of a file or None if it doesn't exist
+    """
+    md5 = hashlib.md5()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                md5.update(block)
+    except (IOError, OSError):
+        return None
+    return md5.hexdigest()
+
+
+def config_hash(config):
+    """Return the md5 hex digest of the ProviderConfig values
+    """
+    return hashlib.md5(repr(sorted(vars(config).items()))).hexdigest()
+
+
+class Manifest(object):
+    def __init__(self, path):
+        self.path = path
+        self.inputs = {}
+        self.outputs = {}
+        try:
+            with open(path, 'rb') as f:
+                data = json.load(f)
+            self.inputs = data.get('inputs', {})
+            self.outputs = data.get('outputs', {})
+        except (IOError, OSError, ValueError):
+            pass
+
+    def is_current(self, inputs):
+        """True if the inputs match the last run and its output files are untouched
+        """
+        return bool(self.outputs) and self.inputs == inputs and \
+            all(file_hash(path) == digest for path, digest in self.outputs.iteritems())
+
+    def update(self, inputs, outputs):
+        """Record the inputs and the current content of the output files
+
+        Returns the output files that were added, changed or removed since the last run
+        """
+        previous = self.outputs
+        self.inputs = inputs
+        hashes = ((path, file_hash(path)) for path in outputs)
+        self.outputs = dict((path, digest) for path, digest in hashes if digest)
+        return set(path for path in set(previous) | set(self.outputs)
+                   if previous.get(path) != self.outputs.get(path))
+
+    def save(self):
+        with open(self.path + '.tmp', 'wb') as f:
+            json.dump({'inputs': self.inputs, 'outputs': self.outputs}, f, indent=1, sort_keys=True)
+        os.rename(self.path + '.tmp', self.path)
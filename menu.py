@@ -7,7 +7,7 @@ import tempfile
 import enigma
 import log
 
-import e2m3u2bouquet
+from lazyimport import LazyModule
 import plugin as E2m3u2b_Plugin
 from about import E2m3u2b_About
 from providers import E2m3u2b_Providers
@@ -31,6 +31,9 @@ try:
 except ImportError:
     EPGImport = None
 
+# imported on first use, see lazyimport
+e2m3u2bouquet = LazyModule('e2m3u2bouquet')
+
 ScreenWidth = enigma.getDesktop(0).size().width()
 ScreenWidth = 'HD' if ScreenWidth and ScreenWidth >= 1920 else 'SD'
 
@@ -179,10 +182,13 @@ class E2m3u2b_Config(ConfigListScreen, Screen):
                 self.list.append(getConfigListEntry(2 * indent + _("Time to start update:"), config.plugins.e2m3u2b.schedulefixedtime, _("Set the day of time to perform the bouquet update")))
         self.list.append(getConfigListEntry(_("Automatic bouquet update (when box starts):"), config.plugins.e2m3u2b.autobouquetupdateatboot, _("Update bouquets at startup")))
         self.list.append(getConfigListEntry(_("Picon save path:"), config.plugins.e2m3u2b.iconpath, _("Select where to save picons (if download is enabled)")))
+        self.list.append(getConfigListEntry(_("Concurrent picon downloads:"), config.plugins.e2m3u2b.piconworkers, _("Number of picons downloaded at the same time (if download is enabled)")))
         if EPGImport:
             self.list.append(getConfigListEntry(_("Attempt Epg Import:"), config.plugins.e2m3u2b.do_epgimport, _("Automatically run Epg Import after bouquet update")))
         self.list.append(getConfigListEntry(_("Show in extensions:"), config.plugins.e2m3u2b.extensions, _("Show in extensions menu")))
         self.list.append(getConfigListEntry(_("Show in main menu:"), config.plugins.e2m3u2b.mainmenu, _("Show in main menu")))
+        self.list.append(getConfigListEntry(_("Log lines kept:"), config.plugins.e2m3u2b.loglines, _("Number of lines shown in the plugin log")))
+        self.list.append(getConfigListEntry(_("Write log to file:"), config.plugins.e2m3u2b.logtofile, _("Also write the log to {}").format(E2m3u2b_Plugin.LOG_FILE)))
         self.list.append(getConfigListEntry(_("Debug mode:"), config.plugins.e2m3u2b.debug, _("Enable debug mode. Do not enable unless requested")))
 
         self['config'].list = self.list
@@ -240,7 +246,12 @@ class E2m3u2b_Status(Screen):
         self["key_red"] = Button(_("Close"))
 
         if config.plugins.e2m3u2b.last_update:
-            self["about"].setText('Last channel update: {}'.format(config.plugins.e2m3u2b.last_update.value))
+            text = 'Last channel update: {}'.format(config.plugins.e2m3u2b.last_update.value)
+            # stage timings are only known for updates since the last restart
+            metrics = e2m3u2bouquet.Status.metrics_summary()
+            if metrics:
+                text += '\n\n' + metrics
+            self["about"].setText(text)
 
     def keyCancel(self):
         self.close()
@@ -286,8 +297,7 @@ class E2m3u2b_Log(Screen):
         self.close(True)
 
     def keyClear(self):
-        log.logfile.reset()
-        log.logfile.truncate()
+        log.clear()
         self.close(False)
 
     def keySave(self):
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Provider run metrics
+
+Every stage of a provider run (playlist download, parse, overrides, picons,
+bouquets, EPG config) is recorded as a span with its wall time and counters
+such as the bytes downloaded, channels processed and files written. The last
+runs are kept in CFGPATH/<provider>-metrics.json for trend analysis.
+"""
+
+import os
+import json
+import time
+from contextlib import contextmanager
+
+HISTORY = 30
+
+
+class Span(object):
+    __slots__ = ('name', 'depth', 'start', 'seconds', 'counters')
+
+    def __init__(self, name, depth=0):
+        self.name = name
+        self.depth = depth
+        self.start = time.time()
+        self.seconds = None
+        self.counters = {}
+
+    def add(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def to_dict(self):
+        return {'name': self.name, 'depth': self.depth, 'start': self.start, 'seconds': self.seconds, 'counters': self.counters}
+
+    def summary(self):
+        seconds = self.seconds if self.seconds is not None else time.time() - self.start
+        counters = ', '.join('{} {}'.format(_format_counter(counter, value), counter)
+                             for counter, value in sorted(self.counters.iteritems()))
+        return '{} {:.2f}s{}'.format(self.name, seconds, ' ({})'.format(counters) if counters else '')
+
+
+def _format_counter(counter, value):
+    if counter == 'bytes' and value >= 1024 * 1024:
+        return '{:.1f}M'.format(value / 1048576.0)
+    return str(value)
+
+
+class RunMetrics(object):
+    """Stage spans of one provider run
+
+    Spans may nest (e.g. the EPG download during the playlist download),
+    add() counts to the innermost open span
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.start = time.time()
+        self.seconds = None
+        self.spans = []
+        self._open = []
+
+    @contextmanager
+    def span(self, name):
+        span = Span(name, len(self._open))
+        self.spans.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            span.seconds = time.time() - span.start
+            self._open.remove(span)
+
+    def add(self, counter, value=1):
+        if self._open:
+            self._open[-1].add(counter, value)
+
+    @property
+    def stage(self):
+        """Name of the running stage or None"""
+        return self._open[-1].name if self._open else None
+
+    def finish(self):
+        self.seconds = time.time() - self.start
+
+    def to_dict(self):
+        return {'provider': self.provider, 'start': self.start, 'seconds': self.seconds,
+                'spans': [span.to_dict() for span in self.spans]}
+
+    def summary(self):
+        """One line per span, slowest stages are easy to spot"""
+        seconds = self.seconds if self.seconds is not None else time.time() - self.start
+        lines = ['[{}] {:.2f}s'.format(self.provider, seconds)]
+        lines.extend('  ' * (span.depth + 1) + span.summary() for span in self.spans)
+        return '\n'.join(lines)
+
+
+class MetricsHistory(object):
+    """The last `history` runs of a provider"""
+
+    def __init__(self, path, history=HISTORY):
+        self.path = path
+        self.history = history
+        self.runs = []
+        try:
+            with open(path, 'rb') as f:
+                self.runs = json.load(f).get('runs', [])
+        except (IOError, OSError, ValueError, AttributeError):
+            pass
+
+    def append(self, metrics):
+        self.runs.append(metrics.to_dict())
+        del self.runs[:-self.history]
+
+    def save(self):
+        with open(self.path + '.tmp', 'wb') as f:
+            json.dump({'runs': self.runs}, f, indent=1, sort_keys=True)
+        os.rename(self.path + '.tmp', self.path)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Local network identity
+
+The box address used in the EPG source urls and by the channels file server
+is resolved once and shared. It is resolved again once it is older than
+MAX_AGE (e.g. a new DHCP lease or a switch between LAN and WLAN) or after
+invalidate(), which the plugin calls at the start of every update.
+"""
+
+import time
+import threading
+from socket import socket, error as socket_error, AF_INET, SOCK_DGRAM
+
+MAX_AGE = 300
+
+
+class NetworkUnreachable(IOError):
+    pass
+
+
+class LocalAddress(object):
+    def __init__(self, probe=('1.1.1.1', 0), max_age=MAX_AGE):
+        self.probe = probe
+        self.max_age = max_age
+        self._address = None
+        self._resolved = 0
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        # connecting to a UDP address doesn't send packets
+        s = socket(AF_INET, SOCK_DGRAM)
+        try:
+            s.connect(self.probe)
+            return s.getsockname()[0]
+        except socket_error, e:
+            raise NetworkUnreachable('Network is unreachable: {}'.format(e))
+        finally:
+            s.close()
+
+    def get(self):
+        """Return the local IPv4 address, raises NetworkUnreachable without a route
+        """
+        with self._lock:
+            if self._address is None or time.time() - self._resolved > self.max_age:
+                self._address = self._resolve()
+                self._resolved = time.time()
+            return self._address
+
+    def invalidate(self):
+        with self._lock:
+            self._address = None
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+System time from NTP
+
+All the servers are asked at the same time, each in a daemon thread, and the
+answer with the lowest round trip delay wins: the first answer only waits
+GRACE seconds more for a better one and a box without working DNS gives up
+after TIMEOUT seconds instead of trying one server after the other. The
+measured offset is kept for REFRESH seconds, so an update right after the
+boot time sync doesn't ask again.
+"""
+
+import time
+import Queue
+import ctypes
+import ctypes.util
+import threading
+import ntplib
+
+SERVERS = ('pool.ntp.org', 'time.google.com', 'time.cloudflare.com', 'time.apple.com', 'time.nist.gov')
+TIMEOUT = 3
+GRACE = 0.5
+REFRESH = 6 * 3600
+# smaller offsets are left alone, stepping the clock is worse than being slightly off
+STEP_MIN = 0.5
+
+CLOCK_REALTIME = 0
+
+
+class NtpSample(object):
+    __slots__ = ('host', 'offset', 'delay')
+
+    def __init__(self, host, offset, delay):
+        self.host = host
+        self.offset = offset
+        self.delay = delay
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long),
+                ('tv_nsec', ctypes.c_long)]
+
+
+def _ask(host, timeout, results):
+    try:
+        response = ntplib.NTPClient().request(host, version=3, port=123, timeout=timeout)
+        # leap indicator 3: the server clock is not synchronized
+        if response.leap == 3 or not response.stratum:
+            raise ntplib.NTPException('{} is not synchronized'.format(host))
+        results.put(NtpSample(host, response.offset, response.delay))
+    except Exception:
+        results.put(None)
+
+
+def query(servers=SERVERS, timeout=TIMEOUT, grace=GRACE):
+    """Ask all servers at once, returns the NtpSample with the lowest delay or None
+    """
+    results = Queue.Queue()
+    for host in servers:
+        # name lookups have no timeout, a hanging thread is left behind
+        t = threading.Thread(target=_ask, args=(host, timeout, results))
+        t.daemon = True
+        t.start()
+
+    best = None
+    deadline = time.time() + timeout
+    for i in xrange(len(servers)):
+        try:
+            sample = results.get(timeout=max(0, deadline - time.time()))
+        except Queue.Empty:
+            break
+        if sample is None:
+            continue
+        if best is None:
+            deadline = min(deadline, time.time() + grace)
+        if best is None or sample.delay < best.delay:
+            best = sample
+    return best
+
+
+def step_clock(offset):
+    """Move the system time by offset seconds (needs root)
+    """
+    # clock_settime is in librt on old C libraries
+    librt = ctypes.CDLL(ctypes.util.find_library('rt'), use_errno=True)
+    now = time.time() + offset
+    ts = _timespec()
+    ts.tv_sec = int(now)
+    ts.tv_nsec = int((now - ts.tv_sec) * 1e9)
+    if librt.clock_settime(CLOCK_REALTIME, ctypes.byref(ts)) != 0:
+        raise OSError(ctypes.get_errno(), 'clock_settime failed')
+
+
+class NtpClock(object):
+    def __init__(self, servers=SERVERS, refresh=REFRESH):
+        self.servers = servers
+        self.refresh = refresh
+        self.sample = None
+        self._measured = None
+        self._lock = threading.Lock()
+
+    def sync(self, force=False):
+        """Set the system time unless it was set less than refresh seconds ago
+
+        Concurrent callers wait for the running query
+        Returns the offset applied in seconds or None if nothing was measured
+        """
+        with self._lock:
+            if not force and self._measured is not None and abs(time.time() - self._measured) < self.refresh:
+                return None
+            sample = query(self.servers)
+            if sample is None:
+                return None
+            offset = sample.offset if abs(sample.offset) >= STEP_MIN else 0.0
+            if offset:
+                step_clock(offset)
+            self.sample = sample
+            self._measured = time.time()
+            return offset
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Parsed <provider>-sort-override.xml
+
+A provider run reads the override file in several passes (bouquet order,
+channel order/overrides and xmltv extra sources). It is parsed once into a
+SortOverride, and the parsed form is cached on disk keyed by the file path,
+mtime and size so that scheduled updates with an unchanged override file skip
+the XML parsing.
+"""
+
+import os
+import marshal
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+CACHE_VERSION = 1
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, str) else value
+
+
+def _attrib(node):
+    return dict((key, _text(value)) for key, value in node.attrib.items())
+
+
+class SortOverride(object):
+    def __init__(self, categories=None, channels=None, xmltv_sources=None):
+        # [{attribute: value}] of the <category> nodes in file order
+        self.categories = categories or []
+        # [(name, category, categoryOverride, {attribute: value})] of the <channel> nodes in file order
+        self.channels = channels or []
+        # [(group id, [url])] of the <xmltvextrasources> groups
+        self.xmltv_sources = xmltv_sources or []
+
+    @classmethod
+    def parse(cls, path):
+        tree = ET.parse(path).getroot()
+        categories = [_attrib(node) for node in tree.iter('category')]
+        channels = []
+        for node in tree.iter('channel'):
+            attrib = _attrib(node)
+            channels.append((attrib.get('name', u''), attrib.get('category', u''), attrib.get('categoryOverride', u''), attrib))
+        xmltv_sources = [(_text(group.attrib.get('id')), [_text(url.text) for url in group])
+                         for group in tree.findall('.//xmltvextrasources/group')]
+        return cls(categories, channels, xmltv_sources)
+
+    def _dump(self):
+        return (self.categories, self.channels, self.xmltv_sources)
+
+
+def load(path, cache_file=None):
+    """Return the SortOverride of path, from cache_file if the file is unchanged
+    """
+    st = os.stat(path)
+    key = (CACHE_VERSION, path, st.st_mtime, st.st_size)
+
+    if cache_file and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_key, data = marshal.load(f)
+            if tuple(cached_key) == key:
+                return SortOverride(*data)
+        except Exception:
+            pass  # unreadable cache, parse the xml again
+
+    mapping = SortOverride.parse(path)
+
+    if cache_file:
+        try:
+            with open(cache_file + '.tmp', 'wb') as f:
+                marshal.dump((key, mapping._dump()), f)
+            os.rename(cache_file + '.tmp', cache_file)
+        except (IOError, OSError, ValueError):
+            pass
+    return mapping
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent picon downloader
+
+Logos are fetched by a pool of threads sharing one requests.Session, so the
+connections to a logo host are kept alive and reused, with at most per_host
+requests in flight per host. The downloaded bytes are handed back to the
+calling thread which does the PIL decode / thumbnail / PNG save, so image work
+never holds up the network threads.
+
+What was fetched, when and with which result is kept in a PiconDB: failed
+logos are retried with an exponential backoff and downloaded picons are
+revalidated with conditional requests once they are REFRESH_INTERVAL old.
+"""
+
+import os
+import json
+import hashlib
+import requests
+from io import BytesIO
+from requests.adapters import HTTPAdapter
+from urllib3.packages.six.moves.urllib.parse import urlparse
+from taskpool import map_unordered
+try:
+    from PIL import Image
+    USE_PIL = True
+except ImportError:
+    USE_PIL = False
+
+PICON_SIZE = (220, 132)
+
+# Revalidate a downloaded logo after a week
+REFRESH_INTERVAL = 7 * 24 * 3600
+# Retry a failed logo after 6h, 12h, 24h ... at most monthly
+RETRY_INTERVAL = 6 * 3600
+RETRY_INTERVAL_MAX = 30 * 24 * 3600
+
+
+class PiconFetch(object):
+    """Result of one logo request, status is 0 if no response was received"""
+    __slots__ = ('name', 'url', 'status', 'content', 'etag', 'last_modified', 'error')
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.status = 0
+        self.content = None
+        self.etag = None
+        self.last_modified = None
+        self.error = None
+
+
+class PiconDownloader(object):
+    def __init__(self, workers=8, per_host=4, headers=None, timeout=(5, 30)):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(headers or {})
+        self.session.verify = False
+
+    def _fetch(self, job):
+        name, url, headers = job
+        result = PiconFetch(name, url)
+        try:
+            with self.session.get(url, headers=headers, timeout=self.timeout) as r:
+                result.status = r.status_code
+                r.raise_for_status()
+                if r.status_code != requests.codes.not_modified:
+                    result.content = r.content
+                result.etag = r.headers.get('ETag')
+                result.last_modified = r.headers.get('Last-Modified')
+        except Exception, e:
+            result.error = e
+        return result
+
+    def fetch(self, jobs):
+        """Download the (name, logo url, request headers) jobs concurrently
+
+        Yields a PiconFetch per job in completion order
+        """
+        results = map_unordered(self._fetch, jobs, self.workers,
+                                key=lambda job: urlparse(job[1]).hostname, per_key=self.per_host)
+        for job, result in results:
+            yield result
+
+    def close(self):
+        self.session.close()
+
+
+class PiconIndex(object):
+    """Picons present in a directory: file name without extension -> extension
+
+    The directory is listed once instead of a glob per service, and picons
+    written during the run are added with add(). Empty '.None' markers left
+    by older versions for logos that failed to download are indexed as
+    extension 'None'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        for fname in names:
+            name, ext = os.path.splitext(fname)
+            # a picon wins over a failed download marker of the same name
+            if ext and self._files.get(name, 'None') == 'None':
+                self._files[name] = ext[1:]
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def __len__(self):
+        return len(self._files)
+
+    def get(self, name):
+        return self._files.get(name)
+
+    def has_picon(self, name):
+        return self._files.get(name, 'None') != 'None'
+
+    def add(self, name, ext):
+        self._files[name] = ext
+
+    def remove(self, name):
+        self._files.pop(name, None)
+
+
+class PiconDB(object):
+    """Download state of the picons, stored as JSON
+
+    name -> {url, checked (last attempt), status (last HTTP status, 0 for no
+    response or an invalid image), hash (md5 of the downloaded logo), etag,
+    last_modified, failures (consecutive), retry (time of the next attempt)}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        try:
+            with open(path, 'rb') as f:
+                self._entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def get(self, name):
+        return self._entries.get(name)
+
+    def due(self, now, has_picon):
+        """True if a picon needs a request: its retry / refresh time has come or it was deleted
+        """
+        return any(now >= entry['retry'] or (entry['hash'] and not has_picon(name))
+                   for name, entry in self._entries.iteritems())
+
+    def retain(self, names):
+        """Forget the picons not in names (channels no longer in the playlist)
+        """
+        for name in set(self._entries) - set(names):
+            del self._entries[name]
+
+    def check(self, name, url, has_picon, now):
+        """Return the request headers to (re)fetch a picon or None if it doesn't need a request
+
+        Picons without an entry that are already on disk (user supplied or
+        downloaded before the database existed) are left alone, deleting a
+        downloaded picon forces a new download.
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            return None if has_picon else {}
+        if entry['url'] != url:
+            return {}
+        # a downloaded picon deleted by hand is fetched again right away
+        if not has_picon and entry['hash']:
+            return {}
+        if now < entry['retry']:
+            return None
+        if has_picon and entry['hash']:
+            headers = {}
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+        return {}
+
+    def changed(self, name, content):
+        """True unless content is the logo of the last successful download
+        """
+        entry = self._entries.get(name)
+        return not entry or entry['hash'] != hashlib.md5(content).hexdigest()
+
+    def success(self, result, now):
+        """Record a 200 (content set) or 304 answer
+        """
+        entry = self._entries.get(result.name) or {}
+        if result.content is None:
+            digest = entry.get('hash')
+            etag = result.etag or entry.get('etag')
+            last_modified = result.last_modified or entry.get('last_modified')
+        else:
+            digest = hashlib.md5(result.content).hexdigest()
+            etag, last_modified = result.etag, result.last_modified
+        self._entries[result.name] = {
+            'url': result.url,
+            'checked': now,
+            'status': result.status,
+            'hash': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'failures': 0,
+            'retry': now + REFRESH_INTERVAL,
+        }
+
+    def failure(self, result, now):
+        """Record a failed download or an invalid image, the next retry backs off exponentially
+        """
+        entry = self._entries.get(result.name) or {}
+        # a failed refresh keeps the picon on disk and its validators
+        same_url = entry.get('url') == result.url
+        failures = (entry.get('failures', 0) if same_url else 0) + 1
+        self._entries[result.name] = {
+            'url': result.url,
+            'checked': now,
+            'status': result.status if result.status >= 400 else 0,
+            'hash': entry.get('hash') if same_url else None,
+            'etag': entry.get('etag') if same_url else None,
+            'last_modified': entry.get('last_modified') if same_url else None,
+            'failures': failures,
+            'retry': now + min(RETRY_INTERVAL * 2 ** (failures - 1), RETRY_INTERVAL_MAX),
+        }
+
+    def save(self):
+        with open(self.path + '.tmp', 'wb') as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.rename(self.path + '.tmp', self.path)
+
+
+def save_picon(content, filename):
+    """Convert the downloaded logo to a PNG picon
+    """
+    im = Image.open(BytesIO(content))
+    if im.format is None:
+        raise ValueError('Not valid image format!')
+    im.thumbnail(PICON_SIZE)
+    im.convert('RGBA').save(filename, format='PNG')
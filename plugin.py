@@ -2,10 +2,15 @@
 #for localized messages
 from . import _
 
+import time
+# plugin load time, logged at the end of this module
+_load_start = time.time()
+
 import os
 import log
-import time
+import tempfile
 import errno
+import threading
 import enigma
 
 from menu import E2m3u2b_Menu
@@ -27,7 +32,11 @@ try:
 except:
 	from Tools.DreamboxHardware import setRTCtime
 
-import e2m3u2bouquet
+import defaults
+from lazyimport import LazyModule
+
+# the converter and its libraries are imported on first use or by start_services()
+e2m3u2bouquet = LazyModule('e2m3u2bouquet')
 
 try:
     import Plugins.Extensions.EPGImport.EPGImport as EPGImport
@@ -40,24 +49,13 @@ autoStartTimer = None
 _session = None
 providers_list = {}
 piconPaths = []
-
-try:
-    e2m3u2bouquet._set_time()
-    nowTime = time.time()
-    if nowTime > 1514808000:
-	setRTCtime(nowTime)
-        print>>log, '[e2m3u2b] [{}] Set system time from NTP'.format(time.strftime('%c', time.localtime(int(time.time()))))
-except: pass
-
-try:
-    e2m3u2bouquet.web_server()
-    print>>log, '[e2m3u2b] [{}] Web service on port {} started'.format(time.strftime('%c', time.localtime(int(time.time()))), e2m3u2bouquet.PORT)
-except: pass
+web_service = None
+_web_service_lock = threading.Lock()
 
 def initPiconPaths():
     global piconPaths
     piconPaths = []
-    piconPaths.append(e2m3u2bouquet.PICONSPATH)
+    piconPaths.append(defaults.PICONSPATH)
     map(lambda part: onMountpointAdded(part.mountpoint), harddiskmanager.getMountedPartitions())
 
 def onMountpointAdded(mountpoint):
@@ -93,14 +91,20 @@ config.plugins.e2m3u2b.scheduletype = ConfigSelection(default='interval', choice
 config.plugins.e2m3u2b.updateinterval = ConfigSelectionNumber(default=6, min=2, max=48, stepwidth=1)
 config.plugins.e2m3u2b.schedulefixedtime = ConfigClock(default=0)
 config.plugins.e2m3u2b.autobouquetupdateatboot = ConfigYesNo(default=False)
-config.plugins.e2m3u2b.iconpath = ConfigSelection(default=e2m3u2bouquet.PICONSPATH, choices=getMounted())
+config.plugins.e2m3u2b.iconpath = ConfigSelection(default=defaults.PICONSPATH, choices=getMounted())
+config.plugins.e2m3u2b.piconworkers = ConfigSelectionNumber(default=defaults.PICON_WORKERS, min=1, max=16, stepwidth=1)
 config.plugins.e2m3u2b.last_update = ConfigText()
 config.plugins.e2m3u2b.extensions = ConfigYesNo(default=False)
 config.plugins.e2m3u2b.mainmenu = ConfigYesNo(default=False)
 config.plugins.e2m3u2b.do_epgimport = ConfigYesNo(default=False)
 config.plugins.e2m3u2b.debug = ConfigOnOff(default=False)
+config.plugins.e2m3u2b.loglines = ConfigSelectionNumber(default=log.CAPACITY, min=100, max=5000, stepwidth=100)
+config.plugins.e2m3u2b.logtofile = ConfigYesNo(default=False)
 config.plugins.e2m3u2b.cfglevel = ConfigText(default='')
 
+# rotated by the log module, the log screen saves to e2m3u2bouquet.log
+LOG_FILE = os.path.join(tempfile.gettempdir(), 'e2m3u2bouquet-full.log')
+
 class AutoStartTimer:
     def __init__(self, session):
         self.session = session
@@ -164,7 +168,7 @@ class AutoStartTimer:
         # if close enough to wake time do bouquet update
         if wake - now < 60:
             try:
-                start_update()
+                start_update(incremental=True)
             except Exception, e:
                 print>> log, "[e2m3u2b] on_timer Error:", e
                 if config.plugins.e2m3u2b.debug.value:
@@ -174,9 +178,14 @@ class AutoStartTimer:
     def get_status(self):
         print>> log, '[e2m3u2b] [{}] AutoStartTimer -> getStatus'.format(time.strftime('%c', time.localtime(int(time.time()))))
 
-def start_update(epgimport=None):
+def start_update(epgimport=None, incremental=False):
     """Run m3u channel update
+
+    incremental: keep the bouquets of unchanged providers instead of resetting all bouquets
     """
+    # the box address is looked up once per update and shared by all the providers
+    e2m3u2bouquet.LOCAL_ADDRESS.invalidate()
+    e2m3u2bouquet.Status.reset_metrics()
     e2m3u2b_config = e2m3u2bouquet.Config()
     if fileExists(os.path.join(e2m3u2bouquet.CFGPATH, 'config.xml')):
         e2m3u2b_config.read_config(os.path.join(e2m3u2bouquet.CFGPATH, 'config.xml'))
@@ -192,10 +201,10 @@ def start_update(epgimport=None):
                 epgimport_sourcefiles.append(epgimport_sourcefilename)
 
         if twisted.python.runtime.platform.supportsThreads():
-            d = threads.deferToThread(start_process_providers, providers_to_process, e2m3u2b_config)
+            d = threads.deferToThread(start_process_providers, providers_to_process, e2m3u2b_config, incremental)
             d.addCallback(start_update_callback, epgimport_sourcefiles, int(time.time()), epgimport)
         else:
-            start_process_providers(providers_to_process, e2m3u2b_config)
+            start_process_providers(providers_to_process, e2m3u2b_config, incremental)
             start_update_callback(None, epgimport_sourcefiles, int(time.time()), epgimport)
 
 
@@ -218,32 +227,83 @@ def start_update_callback(result, epgimport_sourcefiles, start_time, epgimport=N
         epgimport.beginImport(longDescUntil=time.time() + (5 * 24 * 3600))
 
 
-def start_process_providers(providers_to_process, e2m3u2b_config):
+def sync_time():
+    """Set the system and RTC time from NTP, blocks up to ntp.TIMEOUT seconds
+    """
     try:
-        e2m3u2bouquet._set_time()
+        offset = e2m3u2bouquet._set_time()
         nowTime = time.time()
-        if nowTime > 1514808000:
+        if offset is not None and nowTime > 1514808000:
             setRTCtime(nowTime)
-            print>>log, '[e2m3u2b] [{}] Set system time from NTP'.format(time.strftime('%c', time.localtime(int(time.time()))))
-    except: pass
+            print>>log, '[e2m3u2b] [{}] Set system time from NTP {} (offset {:.3f}s)'.format(time.strftime('%c', time.localtime(int(time.time()))), e2m3u2bouquet.NTP_CLOCK.sample.host, offset)
+    except Exception, e:
+        print>>log, '[e2m3u2b] NTP time sync failed:', e
 
-    do_reset()
+def start_web_service():
+    """Serve the EPG files, retried by every update until it could be started
+    """
+    global web_service
+    with _web_service_lock:
+        if web_service is not None:
+            return
+        try:
+            web_service = e2m3u2bouquet.web_server()
+            print>>log, '[e2m3u2b] [{}] Web service on port {} started'.format(time.strftime('%c', time.localtime(int(time.time()))), e2m3u2bouquet.PORT)
+        except Exception, e:
+            print>>log, '[e2m3u2b] Web service not started:', e
 
+def start_services():
+    """Import the converter, start the web service and set the time off the GUI thread
+    """
+    start = time.time()
+    e2m3u2bouquet.load()
+    loaded = time.time()
+    start_web_service()
+    served = time.time()
+    sync_time()
+    print>>log, '[e2m3u2b] [{}] Services started in {:.3f}s (imports {:.3f}s, web service {:.3f}s, NTP {:.3f}s)'.format(
+        time.strftime('%c', time.localtime(int(time.time()))), time.time() - start, loaded - start, served - loaded, time.time() - served)
+
+def start_process_providers(providers_to_process, e2m3u2b_config, incremental=False):
+    start_web_service()
+    sync_time()
+
+    # only remove the bouquets of providers that are no longer enabled, the others are
+    # replaced file by file when their run commits, so a failed run keeps the old ones
+    changed_files = e2m3u2bouquet.uninstaller(keep_providers=[p.name for p in providers_to_process])
+
+    providers = []
     for provider_config in providers_to_process:
         provider = e2m3u2bouquet.Provider(provider_config)
 
         # Use plugin config picon path if none set
         if not provider.config.icon_path:
             provider.config.icon_path = config.plugins.e2m3u2b.iconpath.value
-
-        print>> log, '[e2m3u2b] [{}] Starting update: {}'.format(time.strftime('%c', time.localtime(int(time.time()))), provider.config.name)
-        provider.process_provider()
+        provider.config.picon_workers = config.plugins.e2m3u2b.piconworkers.value
+        providers.append(provider)
+
+    # providers are downloaded concurrently, bouquets.tv is updated in the configured order
+    for provider in e2m3u2bouquet.process_providers(providers, incremental=incremental, on_start=log_provider_start):
+        changed_files = e2m3u2bouquet.merge_changed_files(changed_files, provider)
+        if provider.error is not None:
+            print>> log, '[e2m3u2b] [{}] Update failed: {} Error: {}'.format(time.strftime('%c', time.localtime(int(time.time()))), provider.config.name, provider.error)
+            continue
         print>> log, '[e2m3u2b] [{}] Finished update: {}'.format(time.strftime('%c', time.localtime(int(time.time()))), provider.config.name)
+        print>> log, '[e2m3u2b] Stages {}'.format(provider.metrics.summary())
 
     config.plugins.e2m3u2b.last_update.value = time.strftime('%c', time.localtime(time.time()))
     config.plugins.e2m3u2b.last_update.save()
 
-    e2m3u2bouquet.reload_bouquets()
+    # one reload for the whole update, changed_files includes the files of the disabled providers
+    # removed by the uninstaller above
+    reload_time = e2m3u2bouquet.reload_bouquets(changed_files)
+    if reload_time is None:
+        print>> log, '[e2m3u2b] [{}] No bouquet changes, reload skipped'.format(time.strftime('%c', time.localtime(int(time.time()))))
+    else:
+        print>> log, '[e2m3u2b] [{}] Bouquets reloaded in {:.2f}s'.format(time.strftime('%c', time.localtime(int(time.time()))), reload_time)
+
+def log_provider_start(provider):
+    print>> log, '[e2m3u2b] [{}] Starting update: {}'.format(time.strftime('%c', time.localtime(int(time.time()))), provider.config.name)
 
 def epgimport_sources(sourcefiles):
     for sourcefile in sourcefiles:
@@ -262,8 +322,7 @@ def do_reset():
     """Reset bouquets and
     epg importer config by running the script uninstall method
     """
-    e2m3u2bouquet.uninstaller()
-    e2m3u2bouquet.reload_bouquets()
+    e2m3u2bouquet.reload_bouquets(e2m3u2bouquet.uninstaller())
 
 
 def main(session, **kwargs):
@@ -330,6 +389,8 @@ def autostart(reason, session=None, **kwargs):
     if reason == 0 and _session is None:
         if session is not None:
             _session = session
+            # imports and the first NTP sync are slow, keep them off the GUI thread
+            threads.deferToThread(start_services)
             if autoStartTimer is None:
                 autoStartTimer = AutoStartTimer(session)
             if config.plugins.e2m3u2b.autobouquetupdateatboot.value:
@@ -388,6 +449,10 @@ def update_main_menu(cfg_el):
     except Exception, e:
         print>> log, '[e2m3u2b] Failed to update main menu: ', e
 
+def update_log(cfg_el):
+    log.set_capacity(config.plugins.e2m3u2b.loglines.value)
+    log.set_file(LOG_FILE if config.plugins.e2m3u2b.logtofile.value else None)
+
 plugin_name = _('IPTV Bouquet Maker - Dorik edition')
 plugin_description = _("Automated M3U playlists importer")
 
@@ -396,6 +461,8 @@ extDescriptorQuick = PluginDescriptor(name=plugin_name, description=plugin_descr
 extDescriptorQuickMain = PluginDescriptor(name=plugin_name, description=plugin_description, where=PluginDescriptor.WHERE_MENU, fnc=menuHook)
 config.plugins.e2m3u2b.extensions.addNotifier(update_extensions_menu, initial_call=False)
 config.plugins.e2m3u2b.mainmenu.addNotifier(update_main_menu, initial_call=False)
+config.plugins.e2m3u2b.loglines.addNotifier(update_log, initial_call=True)
+config.plugins.e2m3u2b.logtofile.addNotifier(update_log, initial_call=False)
 
 def Plugins(**kwargs):
     result = [
@@ -430,3 +497,5 @@ def Plugins(**kwargs):
     if config.plugins.e2m3u2b.mainmenu.value:
         result.append(extDescriptorQuickMain)
     return result
+
+print>>log, '[e2m3u2b] [{}] Plugin loaded in {:.3f}s'.format(time.strftime('%c', time.localtime(int(time.time()))), time.time() - _load_start)
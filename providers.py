@@ -21,7 +21,10 @@ try:
     from Tools.Directoires import SCOPE_ACTIVE_SKIN
 except:
     pass
-import e2m3u2bouquet
+from lazyimport import LazyModule
+
+# imported on first use, see lazyimport
+e2m3u2bouquet = LazyModule('e2m3u2bouquet')
 
 ScreenWidth = getDesktop(0).size().width()
 ScreenWidth = 'HD' if ScreenWidth and ScreenWidth >= 1920 else 'SD'
@@ -199,6 +202,8 @@ class E2m3u2b_Providers_Config(ConfigListScreen, Screen):
         self.provider_picons.value = self.provider.picons
         self.provider_bouquet_top = ConfigSelection(default=False, choices=[(False, _('bottom')), (True, _('top'))])
         self.provider_bouquet_top.value = self.provider.bouquet_top
+        self.provider_epg_filter = ConfigYesNo(default=False)
+        self.provider_epg_filter.value = self.provider.epg_filter
         self.provider_all_bouquet = ConfigYesNo(default=True)
         self.provider_all_bouquet.value = self.provider.all_bouquet
         self.provider_streamtype_tv = ConfigSelection(default='4097', choices=available_players)
@@ -249,6 +254,7 @@ class E2m3u2b_Providers_Config(ConfigListScreen, Screen):
                     self.list.append(getConfigListEntry(indent + _("Create all channels bouquet:"), self.provider_all_bouquet, _("Create a separate bouquet containing all channels")))
                 self.list.append(getConfigListEntry(_("IPTV bouquet position:"), self.provider_bouquet_top, _("Select where to place IPTV bouquets")))
                 if self.provider_settings_level.value == '1':
+                    self.list.append(getConfigListEntry(_("Filter EPG:"), self.provider_epg_filter, _("Serve a copy of the EPG with only the playlist channels, EPG import gets faster")))
                     self.list.append(getConfigListEntry(_("Live Player Type:"), self.provider_streamtype_tv, _("Stream player type for TV services")))
 
                     if self.provider_streamtype_tv.value == '4097':
@@ -305,6 +311,7 @@ class E2m3u2b_Providers_Config(ConfigListScreen, Screen):
         self.provider.multi_vod = self.provider_multi_vod.value
         self.provider.picons = self.provider_picons.value
         self.provider.bouquet_top = self.provider_bouquet_top.value
+        self.provider.epg_filter = self.provider_epg_filter.value
         self.provider.all_bouquet = self.provider_all_bouquet.value
         self.provider.streamtype_tv = self.provider_streamtype_tv.value.strip()
         # 4097 Gstreamer options
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded thread pool for network bound work
+
+map_ordered() / map_unordered() run a function over a list of items with at
+most `workers` threads and at most `per_key` concurrent calls for items sharing
+the same key (e.g. the host name of a provider url), and yield the results in
+item order / as they complete.
+
+A worker only takes an item whose key has a free slot, so items of a busy host
+don't hold up the items of other hosts queued behind them.
+"""
+
+import sys
+import threading
+import Queue
+from collections import OrderedDict, deque
+
+
+class _Task(object):
+    __slots__ = ('index', 'item', 'key', 'done', 'result', 'error')
+
+    def __init__(self, index, item, key):
+        self.index = index
+        self.item = item
+        self.key = key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _start(func, items, workers, key, per_key, on_done=None):
+    """Start the worker threads, returns the tasks in item order"""
+    tasks = [_Task(i, item, key(item) if key else None) for i, item in enumerate(items)]
+    # key -> its pending tasks in item order
+    pending = OrderedDict()
+    for task in tasks:
+        pending.setdefault(task.key, deque()).append(task)
+    running = {}
+    changed = threading.Condition()
+
+    def next_task():
+        """First pending task whose key has a free slot, None once all are taken"""
+        with changed:
+            while pending:
+                ready = [queue for name, queue in pending.iteritems()
+                         if name is None or running.get(name, 0) < per_key]
+                if not ready:
+                    changed.wait()
+                    continue
+                queue = min(ready, key=lambda queue: queue[0].index)
+                task = queue.popleft()
+                if not queue:
+                    del pending[task.key]
+                running[task.key] = running.get(task.key, 0) + 1
+                return task
+            return None
+
+    def worker():
+        while True:
+            task = next_task()
+            if task is None:
+                return
+            try:
+                task.result = func(task.item)
+            except Exception:
+                task.error = sys.exc_info()
+            finally:
+                with changed:
+                    running[task.key] -= 1
+                    changed.notify_all()
+                task.done.set()
+                if on_done:
+                    on_done(task)
+
+    for i in xrange(min(workers, len(tasks))):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+    return tasks
+
+
+def map_ordered(func, items, workers=4, key=None, per_key=1):
+    """Yield (item, func(item)) in item order while the calls run concurrently
+
+    An exception raised by func is re-raised when its item is reached
+    """
+    for task in _start(func, items, workers, key, per_key):
+        task.done.wait()
+        if task.error:
+            raise task.error[0], task.error[1], task.error[2]
+        yield task.item, task.result
+
+
+def map_unordered(func, items, workers=4, key=None, per_key=1):
+    """Yield (item, func(item)) as soon as each call completes
+
+    An exception raised by func is re-raised when its item is reached
+    """
+    finished = Queue.Queue()
+    tasks = _start(func, items, workers, key, per_key, on_done=finished.put)
+    for i in xrange(len(tasks)):
+        task = finished.get()
+        if task.error:
+            raise task.error[0], task.error[1], task.error[2]
+        yield task.item, task.result
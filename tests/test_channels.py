@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from channels import Channel, ChannelStore, ChannelIndex
+
+
+class ChannelIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.store = ChannelStore()
+        self.a = Channel('a', group_title='A')
+        self.a2 = Channel('a', group_title='A')
+        self.b = Channel('b', group_title='B')
+        self.c = Channel('c', group_title='C')
+        for channel in (self.a, self.a2, self.b, self.c):
+            self.store.add(channel)
+        self.index = ChannelIndex(self.store)
+
+    def test_first(self):
+        self.assertIs(self.index.first('A', 'a'), self.a)
+        self.assertIsNone(self.index.first('A', 'b'))
+        self.assertIsNone(self.index.first('X', 'a'))
+
+    def test_move(self):
+        self.assertIs(self.index.move('a', 'A', 'B'), self.a)
+        self.assertIs(self.index.first('A', 'a'), self.a2)
+        self.assertIs(self.index.first('B', 'a'), self.a)
+        self.index.compact()
+        self.assertEqual(self.store['A'], [self.a2])
+        self.assertEqual(self.store['B'], [self.b, self.a])
+
+    def test_chained_moves(self):
+        self.index.move('a', 'A', 'B')
+        self.index.move('a', 'B', 'C')
+        self.assertIsNone(self.index.first('B', 'a'))
+        self.assertIs(self.index.first('C', 'a'), self.a)
+        self.assertIsNone(self.index.move('a', 'B', 'A'))
+        self.index.compact()
+        self.assertEqual(self.store['A'], [self.a2])
+        self.assertEqual(self.store['B'], [self.b])
+        self.assertEqual(self.store['C'], [self.c, self.a])
+
+    def test_move_back(self):
+        self.index.move('a', 'A', 'B')
+        self.index.move('a', 'B', 'A')
+        self.assertEqual(self.index.first('A', 'a'), self.a2)
+        self.assertIsNone(self.index.first('B', 'a'))
+        self.index.compact()
+        self.assertEqual(self.store['A'], [self.a, self.a2])
+        self.assertEqual(self.store['B'], [self.b])
+
+    def test_move_to_missing_category(self):
+        self.assertIsNone(self.index.move('a', 'A', 'X'))
+        self.assertIs(self.index.first('A', 'a'), self.a)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import m3uparser
+
+
+class ParseAttributesTest(unittest.TestCase):
+    def test_quoted(self):
+        attrs, title = m3uparser.parse_attributes(u'#EXTINF:-1 tvg-id="a.b" tvg-name=\'A, B\',Title', 8)
+        self.assertEqual(attrs, {'tvg-id': u'a.b', 'tvg-name': u'A, B'})
+        self.assertEqual(title, u'Title')
+
+    def test_unquoted(self):
+        attrs, title = m3uparser.parse_attributes(u'#EXTINF:-1 tvg-id=abc.uk group-title=News,BBC News', 8)
+        self.assertEqual(attrs, {'tvg-id': u'abc.uk', 'group-title': u'News'})
+        self.assertEqual(title, u'BBC News')
+
+    def test_unterminated_quote(self):
+        attrs, title = m3uparser.parse_attributes(u'#EXTINF:-1 tvg-id=abc tvg-name="Broken group-title=News,Title', 8)
+        self.assertEqual(attrs, {'tvg-id': u'abc', 'group-title': u'News'})
+        self.assertEqual(title, u'Title')
+
+    def test_empty(self):
+        attrs, title = m3uparser.parse_attributes(u'#EXTINF:-1 tvg-id="" tvg-logo= tvg-name=",Title', 8)
+        self.assertEqual(attrs, {'tvg-id': u'', 'tvg-logo': u''})
+        self.assertEqual(title, u'Title')
+
+
+class TokenizerTest(unittest.TestCase):
+    PLAYLIST = (b'#EXTM3U url-tvg="http://epg.example.com/guide.xml"\n'
+                b'#EXTINF:-1 tvg-id="one",One\n'
+                b'not a url\n'
+                b'http://example.com/1.ts\n'
+                b'#EXTINF:-1 tvg-id="two",Two\n'
+                b'garbage\n'
+                b'#EXTINF:-1 tvg-id="three",Three\n'
+                b'http://example.com/3.ts\n')
+
+    def records(self, is_url=None, chunk=7):
+        chunks = [self.PLAYLIST[i:i + chunk] for i in range(0, len(self.PLAYLIST), chunk)]
+        return list(m3uparser.iter_m3u(chunks, m3uparser.M3UTokenizer(is_url=is_url)))
+
+    def test_skips_lines_until_url(self):
+        records = self.records(lambda line: line.startswith('http://'))
+        self.assertEqual(records[0].attrs, {'url-tvg': u'http://epg.example.com/guide.xml'})
+        self.assertEqual([(r.name, r.url) for r in records[1:]],
+                         [(u'One', u'http://example.com/1.ts'), (u'Three', u'http://example.com/3.ts')])
+
+    def test_without_check(self):
+        records = self.records()
+        self.assertEqual([(r.name, r.url) for r in records[1:]],
+                         [(u'One', u'not a url'), (u'Two', u'garbage'), (u'Three', u'http://example.com/3.ts')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+# the bundled modules, as set up by e2m3u2bouquet
+sys.path.insert(0, os.path.join(ROOT_DIR, 'modules'))
+map(lambda x: sys.path.insert(0, x), glob.glob(os.path.join(ROOT_DIR, 'modules', '*.whl')))
+
+from picons import PiconDB, PiconFetch, REFRESH_INTERVAL, RETRY_INTERVAL, RETRY_INTERVAL_MAX
+
+URL = 'http://logos.example.com/one.png'
+NOW = 1000000
+
+
+def fetch(status, content=None, url=URL, etag=None, last_modified=None):
+    result = PiconFetch('ONE', url)
+    result.status = status
+    result.content = content
+    result.etag = etag
+    result.last_modified = last_modified
+    return result
+
+
+class PiconDBTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = PiconDB(os.path.join(self.tmp, 'picons.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_new(self):
+        self.assertEqual(self.db.check('ONE', URL, False, NOW), {})
+        # user supplied picon
+        self.assertIsNone(self.db.check('ONE', URL, True, NOW))
+
+    def test_backoff(self):
+        for failures in range(1, 10):
+            self.db.failure(fetch(404), NOW)
+            entry = self.db.get('ONE')
+            self.assertEqual(entry['failures'], failures)
+            self.assertEqual(entry['retry'], NOW + min(RETRY_INTERVAL * 2 ** (failures - 1), RETRY_INTERVAL_MAX))
+        self.assertIsNone(self.db.check('ONE', URL, False, NOW + 1))
+        self.assertEqual(self.db.check('ONE', URL, False, NOW + RETRY_INTERVAL_MAX), {})
+        self.db.success(fetch(200, 'logo'), NOW)
+        self.assertEqual(self.db.get('ONE')['failures'], 0)
+
+    def test_url_change(self):
+        self.db.success(fetch(200, 'logo', etag='"1"'), NOW)
+        self.db.failure(fetch(500), NOW)
+        self.assertIsNone(self.db.check('ONE', URL, True, NOW + 1))
+        self.assertEqual(self.db.check('ONE', URL + '?v=2', True, NOW + 1), {})
+        self.db.failure(fetch(404, url=URL + '?v=2'), NOW)
+        entry = self.db.get('ONE')
+        self.assertEqual((entry['failures'], entry['hash'], entry['etag']), (1, None, None))
+
+    def test_refresh_and_not_modified(self):
+        self.db.success(fetch(200, 'logo', etag='"1"', last_modified='Mon, 01 Jan 2018 00:00:00 GMT'), NOW)
+        self.assertIsNone(self.db.check('ONE', URL, True, NOW + 1))
+        headers = self.db.check('ONE', URL, True, NOW + REFRESH_INTERVAL)
+        self.assertEqual(headers, {'If-None-Match': '"1"', 'If-Modified-Since': 'Mon, 01 Jan 2018 00:00:00 GMT'})
+
+        self.db.success(fetch(304), NOW + REFRESH_INTERVAL)
+        entry = self.db.get('ONE')
+        self.assertEqual(entry['etag'], '"1"')
+        self.assertEqual(entry['retry'], NOW + 2 * REFRESH_INTERVAL)
+        self.assertFalse(self.db.changed('ONE', 'logo'))
+        self.assertTrue(self.db.changed('ONE', 'new logo'))
+
+    def test_deleted_picon(self):
+        self.db.success(fetch(200, 'logo', etag='"1"'), NOW)
+        # no conditional headers, a 304 would not restore the file
+        self.assertEqual(self.db.check('ONE', URL, False, NOW + 1), {})
+
+    def test_due(self):
+        self.assertFalse(self.db.due(NOW, lambda name: True))
+        self.db.success(fetch(200, 'logo'), NOW)
+        self.assertFalse(self.db.due(NOW + 1, lambda name: True))
+        self.assertTrue(self.db.due(NOW + 1, lambda name: False))
+        self.assertTrue(self.db.due(NOW + REFRESH_INTERVAL, lambda name: True))
+        self.db.retain(['TWO'])
+        self.assertIsNone(self.db.get('ONE'))
+        self.assertFalse(self.db.due(NOW + REFRESH_INTERVAL, lambda name: False))
+
+    def test_save(self):
+        self.db.success(fetch(200, 'logo'), NOW)
+        self.db.save()
+        self.assertEqual(PiconDB(self.db.path).get('ONE'), self.db.get('ONE'))
+
+
+if __name__ == '__main__':
+    unittest.main()